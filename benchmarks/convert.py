@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of CSV row conversion (AddressesImporter.iterator) on a synthetic aw_eka.csv.
+
+Compares the current converter tuple based iterator with the previous per-cell if/elif implementation.
+
+Usage: python3 benchmarks/convert.py [--rows 200000] [--repeat 3]
+"""
+
+import argparse
+import csv
+import io
+import os.path
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from defs import HousesImporter  # noqa: E402
+
+
+def legacy_iterator(columns, reader):
+    """Row conversion as it was implemented before converters were precompiled"""
+    for row in reader:
+        r = {}
+        for idx, column in enumerate(columns.keys()):
+            value = row[idx]
+            col_type = columns[column] if row[0] != '\ufeff#KODS#' and row[0] != '#KODS#' else 'string'
+            if not len(value) and col_type != 'bool':
+                value = None
+            elif col_type == 'int':
+                value = int(value)
+            elif col_type == 'float':
+                value = float(value)
+            elif col_type == 'bool':
+                value = {'Y': True, '1': True}.get(value, False)
+            elif col_type == 'date':
+                value = value.replace('.', '-') if re.match(r'^\d\d\d\d', value) else re.sub(
+                    r'(\d\d)\.(\d\d)\.(\d\d\d\d)', '\\3-\\2-\\1', value)
+            elif col_type == 'string':
+                pass
+            else:
+                raise RuntimeError(f'Unknown data type {col_type}')
+            r[column] = value
+        yield r
+
+
+def synthetic_houses(rows, seed=1):
+    random.seed(seed)
+    out = io.StringIO()
+    # Files start with BOM, which leaves the first header cell unquoted
+    out.write('\ufeff#KODS#;' + ';'.join(f'#{column.upper()}#' for column in list(HousesImporter.columns)[1:]) + '\n')
+    for code in range(100000000, 100000000 + rows):
+        created = f'{random.randint(1, 28):02}.{random.randint(1, 12):02}.{random.randint(1998, 2022)}'
+        modified = f'{random.randint(1998, 2022)}.{random.randint(1, 12):02}.{random.randint(1, 28):02} 00:00:00'
+        out.write(';'.join([
+            str(code), '108', '#EKS#', 'Y', '253', str(random.randint(100000000, 100100000)), '107',
+            f'#{random.randint(1, 200)}#', f'#{random.randint(1, 200):08}#', '#LV-1050#', str(random.randint(1, 900)),
+            created, modified, '', 'N', '0', f'#Iela {random.randint(1, 200)}, Rīga, LV-1050#',
+            f'{random.uniform(300000, 700000):.3f}', f'{random.uniform(170000, 450000):.3f}',
+            f'{random.uniform(55.6, 58.1):.7f}', f'{random.uniform(20.9, 28.3):.7f}',
+        ]) + '\n')
+
+    return out.getvalue()
+
+
+def measure(name, rows, repeat, run):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{name:>10}: {count} rows in {best:.2f}s, {rows / best:,.0f} rows/s')
+
+    return best
+
+
+if __name__ == '__main__':
+    args_parser = argparse.ArgumentParser(description='Benchmarks CSV row conversion')
+    args_parser.add_argument('--rows', type=int, default=200000)
+    args_parser.add_argument('--repeat', type=int, default=3)
+    args = args_parser.parse_args()
+
+    data = synthetic_houses(args.rows)
+    importer = HousesImporter(conn=None, file=__file__, logger=None)
+
+    def run_legacy():
+        reader = legacy_iterator(HousesImporter.columns, csv.reader(io.StringIO(data), delimiter=';', quotechar='#'))
+        next(reader)
+        return sum(1 for _ in reader)
+
+    def run_current():
+        reader = importer.iterator(csv.reader(io.StringIO(data), delimiter=';', quotechar='#'))
+        return sum(1 for _ in reader)
+
+    before = measure('before', args.rows, args.repeat, run_legacy)
+    after = measure('after', args.rows, args.repeat, run_current)
+    print(f'{"speedup":>10}: {before / after:.2f}x')
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Generates synthetic VZD data: address register CSV files (aw_*.csv), cadastre metadata XML files (*FullData), and
+optionally cadastre shapefile archives (one zip per territory, with all KK* layers, requires pyshp).
+
+CSV files follow the register's dialect: `;` delimited, `#` quoted, starting with BOM (which leaves the first header cell,
+`#KODS#`, unquoted), with dates both as `dd.mm.yyyy` and `yyyy.mm.dd hh:mm:ss`. Addresses form a hierarchy of counties,
+parishes, villages, towns, streets and houses, so that aw_full_addresses has something to join.
+
+Usage: python3 benchmarks/generate.py --houses 100000 --items 50000 [--territories 3 --features 1000] data/bench
+"""
+
+import argparse
+import io
+import os.path
+import random
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from defs import (CitiesImporter, CountiesImporter, HousesImporter, ParishesImporter,  # noqa: E402
+                  StreetsImporter, VillagesImporter)
+
+NAMESPACE = 'http://www.vzd.gov.lv/schemas/kadastrs'
+STREET_NAMES = ['Brīvības', 'Lāčplēša', 'Dzirnavu', 'Skolas', 'Meža', 'Ezera', 'Dārza', 'Liepu', 'Rīgas', 'Jūras']
+OWNERSHIP_STATUSES = ['Īpašumā', 'Tiesiskajā valdījumā', 'Lietošanā']
+PERSON_STATUSES = ['Fiziska persona', 'Juridiska persona', 'Valsts', 'Pašvaldība']
+
+
+def date_dmy(rnd):
+    return f'{rnd.randint(1, 28):02}.{rnd.randint(1, 12):02}.{rnd.randint(1998, 2022)}'
+
+
+def date_ymd(rnd):
+    return f'{rnd.randint(1998, 2022)}.{rnd.randint(1, 12):02}.{rnd.randint(1, 28):02} 00:00:00'
+
+
+def area(importer_class, code, name, parent_code, parent_type, rnd):
+    values = {
+        'code': code,
+        'type': {'aw_novads': 113, 'aw_pagasts': 105, 'aw_ciems': 106, 'aw_pilseta': 104, 'aw_iela': 107}[
+            importer_class.table],
+        'name': name,
+        'parent_code': parent_code,
+        'parent_type': parent_type,
+        'approved': 'Y',
+        'approve_degree': 253,
+        'status': 'EKS' if rnd.random() > 0.05 else 'DEL',
+        'sort_name': name.upper(),
+        'created_at': date_dmy(rnd),
+        'modified_at': date_ymd(rnd),
+        'deleted_at': '',
+        'atvk': f'{rnd.randint(0, 9999999):07}',
+        'is_small': rnd.choice(['Y', 'N']),
+        'attr': '',
+        'full_name': name,
+    }
+
+    return [values[column] for column in importer_class.columns]
+
+
+def house(code, name, parent_code, parent_type, full_name, rnd):
+    # LKS-92 X is northing and Y is easting
+    x, y = rnd.uniform(170000, 450000), rnd.uniform(300000, 760000)
+    values = {
+        'code': code,
+        'type': 108,
+        'status': 'EKS' if rnd.random() > 0.05 else 'DEL',
+        'approved': 'Y',
+        'approve_degree': 253,
+        'parent_code': parent_code,
+        'parent_type': parent_type,
+        'name': name,
+        'sort_name': name.rjust(8, '0'),
+        'postal_code': f'LV-{rnd.randint(1000, 5750)}',
+        'postal_office_area_code': rnd.randint(1000, 9999),
+        'created_at': date_dmy(rnd),
+        'modified_at': date_ymd(rnd),
+        'deleted_at': '',
+        'for_build': rnd.choice(['Y', 'N']),
+        'planned_address': '0',
+        'full_name': full_name,
+        'x': f'{x:.3f}',
+        'y': f'{y:.3f}',
+        'lat': f'{55.6 + (x - 170000) / 280000 * 2.5:.7f}',
+        'lng': f'{20.9 + (y - 300000) / 460000 * 7.4:.7f}',
+    }
+
+    return [values[column] for column in HousesImporter.columns]
+
+
+def write_csv(file_name, importer_class, rows):
+    with open(file_name, 'w', encoding='utf-8', newline='') as f:
+        header = ['KODS'] + [column.upper() for column in list(importer_class.columns)[1:]]
+        f.write('\ufeff' + ';'.join(f'#{column}#' for column in header) + '\n')
+        for row in rows:
+            f.write(';'.join(f'#{value}#' for value in row) + '\n')
+
+
+def generate_addresses(path, houses, seed=1):
+    """Writes aw_*.csv files with roughly the given number of houses, returns file name => row count"""
+    rnd = random.Random(seed)
+    codes = iter(range(100000000, 999999999))
+    tables = {importer_class: [] for importer_class in (
+        CountiesImporter, ParishesImporter, VillagesImporter, CitiesImporter, StreetsImporter, HousesImporter)}
+
+    def add(importer_class, name, parent_code, parent_type):
+        code = next(codes)
+        tables[importer_class].append(area(importer_class, code, name, parent_code, parent_type, rnd))
+        return code
+
+    # Houses are split between towns and villages, about 40 per street and 20 directly in a village
+    settlements = []
+    for novads in range(max(1, houses // 12000)):
+        novads_code = add(CountiesImporter, f'Novads {novads}', 100000001, 101)
+        settlements.append((add(CitiesImporter, f'Pilsēta {novads}', novads_code, 113), 104))
+        for pagasts in range(4):
+            pagasts_code = add(ParishesImporter, f'Pagasts {novads}-{pagasts}', novads_code, 113)
+            for ciems in range(5):
+                settlements.append((add(VillagesImporter, f'Ciems {novads}-{pagasts}-{ciems}', pagasts_code, 105),
+                                    106))
+
+    left = houses
+    while left > 0:
+        for settlement_code, settlement_type in settlements:
+            if left <= 0:
+                break
+            if settlement_type == 106 and rnd.random() < 0.3:
+                parent_code, parent_type, count = settlement_code, settlement_type, min(left, 20)
+            else:
+                street = f'{rnd.choice(STREET_NAMES)} iela'
+                parent_code, parent_type, count = add(StreetsImporter, street, settlement_code, settlement_type), 107, \
+                    min(left, 40)
+            for number in range(1, count + 1):
+                code = next(codes)
+                tables[HousesImporter].append(
+                    house(code, str(number), parent_code, parent_type, f'{number}, {settlement_code}', rnd))
+            left -= count
+
+    counts = {}
+    for importer_class, rows in tables.items():
+        file_name = f'{importer_class.table}.csv'
+        write_csv(os.path.join(path, file_name), importer_class, rows)
+        counts[file_name] = len(rows)
+
+    return counts
+
+
+def relation(i, object_type=None):
+    return (f'<ObjectRelation><ObjectCadastreNr>{i:011d}</ObjectCadastreNr>'
+            f'<ObjectType>{object_type or ("PARCEL" if i % 3 else "BUILDING")}</ObjectType></ObjectRelation>')
+
+
+def mark_item(i, rnd):
+    mark_type = rnd.randint(1, 60)
+    return (f'<MarkItemData>{relation(i)}<MarkList><MarkRecData><MarkType>{mark_type}</MarkType>'
+            f'<MarkDate>{rnd.randint(1998, 2022)}-{rnd.randint(1, 12):02}-{rnd.randint(1, 28):02}</MarkDate>'
+            f'<MarkDescription>Atzīme {mark_type}</MarkDescription></MarkRecData></MarkList></MarkItemData>')
+
+
+def valuation_item(i, rnd):
+    def value(name):
+        return (f'<{name}>{rnd.randint(100, 500000)}</{name}>'
+                f'<{name}Date>{rnd.randint(1998, 2022)}-01-01</{name}Date>')
+
+    return (f'<ValuationItemData>{relation(i)}{value("PropertyValuation")}{value("PropertyCadastralValue")}'
+            f'{value("ObjectCadastralValue")}{value("ObjectForestValue") if rnd.random() < 0.2 else ""}'
+            f'</ValuationItemData>')
+
+
+def address_item(i, rnd):
+    return (f'<AddressItemData>{relation(i)}<AddressData><ARCode>{100000000 + i}</ARCode>'
+            f'<PostIndex>LV{rnd.randint(1000, 5750)}</PostIndex><County>Novads {i % 43}</County>'
+            f'<Parish>Pagasts {i % 97}</Parish><Village>Ciems {i % 311}</Village>'
+            f'<House>Mājas {i % 1000}</House></AddressData></AddressItemData>')
+
+
+def ownership_item(i, rnd):
+    return (f'<OwnershipItemData>{relation(i)}<OwnershipStatusKindList><OwnershipStatusKind><OwnershipStatusKind>'
+            f'<OwnershipStatus>{rnd.choice(OWNERSHIP_STATUSES)}</OwnershipStatus>'
+            f'<PersonStatus>{rnd.choice(PERSON_STATUSES)}</PersonStatus>'
+            f'</OwnershipStatusKind></OwnershipStatusKind></OwnershipStatusKindList></OwnershipItemData>')
+
+
+def property_item(i, rnd):
+    parts = ''.join(f'<PropertyObject><ObjectCadastreNr>{i * 10 + part:011d}</ObjectCadastreNr>'
+                    f'<ObjectType>{"BUILDING" if part else "PARCEL"}</ObjectType></PropertyObject>'
+                    for part in range(rnd.randint(1, 3)))
+    return (f'<PropertyItemData>{relation(i, "PROPERTY")}<PropertyName>Īpašums {i}</PropertyName>'
+            f'<PropertyObjectList>{parts}</PropertyObjectList></PropertyItemData>')
+
+
+def parcel_item(i, rnd):
+    return (f'<ParcelItemData>{relation(i, "PARCEL")}<ParcelBasicData>'
+            f'<ParcelArea>{rnd.randint(100, 500000)}</ParcelArea><ParcelLizValue>{rnd.randint(1, 60)}</ParcelLizValue></ParcelBasicData></ParcelItemData>')
+
+
+def parcel_part_item(i, rnd):
+    return (f'<ParcelPartItemData>{relation(i, "PARCEL_PART")}<ParcelPartBasicData>'
+            f'<ParcelPartArea>{rnd.randint(10, 50000)}</ParcelPartArea></ParcelPartBasicData></ParcelPartItemData>')
+
+
+def encumbrance_item(i, rnd):
+    encumbrances = ''.join(f'<EncumbranceRecData><EncumbranceKindId>{kind}</EncumbranceKindId>'
+                           f'<EncumbranceKindName>Apgrūtinājums {kind}</EncumbranceKindName>'
+                           f'<EncumbranceArea>{rnd.randint(1, 100000) / 100}</EncumbranceArea>'
+                           f'<EncumbranceEstablishDate>{rnd.randint(1998, 2022)}-01-01</EncumbranceEstablishDate>'
+                           f'</EncumbranceRecData>'
+                           for kind in rnd.sample(range(70101, 70140), rnd.randint(1, 4)))
+    return (f'<EncumbranceItemData>{relation(i)}<EncumbranceList>{encumbrances}</EncumbranceList>'
+            f'</EncumbranceItemData>')
+
+
+def building_item(i, rnd):
+    kind = rnd.randint(1110, 1274)
+    return (f'<BuildingItemData>{relation(i, "BUILDING")}<BuildingBasicData><BuildingName>Ēka {i}</BuildingName>'
+            f'<BuildingUseKindId>{kind}</BuildingUseKindId><BuildingUseKindName>Lietošanas veids {kind}'
+            f'</BuildingUseKindName><BuildingArea>{rnd.randint(100, 100000) / 10}</BuildingArea>'
+            f'<BuildingConstrArea>{rnd.randint(100, 50000) / 10}</BuildingConstrArea>'
+            f'<BuildingGroundFloors>{rnd.randint(1, 12)}</BuildingGroundFloors>'
+            f'<BuildingUndergroundFloors>{rnd.randint(0, 2)}</BuildingUndergroundFloors>'
+            f'<BuildingExploitYear>{rnd.randint(1900, 2022)}</BuildingExploitYear>'
+            f'<BuildingFireresistance>U{rnd.randint(1, 3)}</BuildingFireresistance>'
+            f'<BuildingPregCount>{rnd.randint(1, 60)}</BuildingPregCount>'
+            f'<BuildingDeprecation>{rnd.randint(0, 80)}</BuildingDeprecation>'
+            f'<BuildingDepValDate>{rnd.randint(1998, 2022)}-01-01</BuildingDepValDate>'
+            f'</BuildingBasicData></BuildingItemData>')
+
+
+def premise_group_item(i, rnd):
+    kind = rnd.randint(1110, 1274)
+    return (f'<PremiseGroupItemData>{relation(i, "PREMISE_GROUP")}<PremiseGroupBasicData>'
+            f'<PremiseGroupName>Dzīvoklis {i % 100}</PremiseGroupName>'
+            f'<PremiseGroupBuildingFloor>{rnd.randint(1, 12)}</PremiseGroupBuildingFloor>'
+            f'<PremiseGroupUseKindId>{kind}</PremiseGroupUseKindId>'
+            f'<PremiseGroupUseKindName>Lietošanas veids {kind}</PremiseGroupUseKindName>'
+            f'<PremiseGroupPremiseCount>{rnd.randint(1, 8)}</PremiseGroupPremiseCount>'
+            f'<PremiseGroupArea>{rnd.randint(150, 3000) / 10}</PremiseGroupArea>'
+            f'</PremiseGroupBasicData></PremiseGroupItemData>')
+
+
+datasets = {
+    'Mark': mark_item,
+    'Valuation': valuation_item,
+    'Address': address_item,
+    'Ownership': ownership_item,
+    'Property': property_item,
+    'Parcel': parcel_item,
+    'ParcelPart': parcel_part_item,
+    'Encumbrance': encumbrance_item,
+    'Building': building_item,
+    'PremiseGroup': premise_group_item,
+}
+
+
+def generate_metadata(path, items, seed=1, only=None):
+    """
+    Writes *FullData XML files (of only given datasets, all by default) with the given number of items each, returns
+    file name => item count
+    """
+    rnd = random.Random(seed)
+    counts = {}
+    for dataset, item in datasets.items():
+        if only is not None and dataset not in only:
+            continue
+        file_name = f'{dataset.lower()}.xml'
+        with open(os.path.join(path, file_name), 'w', encoding='utf-8') as f:
+            f.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<{dataset}FullData xmlns="{NAMESPACE}">'
+                    f'<{dataset}ItemList>\n')
+            for i in range(items):
+                f.write(item(i, rnd) + '\n')
+            f.write(f'</{dataset}ItemList></{dataset}FullData>\n')
+        counts[file_name] = items
+
+    return counts
+
+
+def parcel(rnd):
+    """Returns rings of a square parcel somewhere in Latvia (LKS-92), sometimes with a hole"""
+    x, y, size = rnd.uniform(300000, 760000), rnd.uniform(170000, 450000), rnd.uniform(10, 500)
+    # Outer rings are clockwise, holes counterclockwise
+    rings = [[(x, y), (x, y + size), (x + size, y + size), (x + size, y), (x, y)]]
+    if rnd.random() < 0.1:
+        x, y, size = x + size / 4, y + size / 4, size / 2
+        rings.append([(x, y), (x + size, y), (x + size, y + size), (x, y + size), (x, y)])
+
+    return rings
+
+
+def write_layer(archive, territory, layer, features, rnd):
+    import shapefile
+
+    shp, shx, dbf = io.BytesIO(), io.BytesIO(), io.BytesIO()
+    points = layer == 'KKParcelBorderPoint'
+    with shapefile.Writer(shp=shp, shx=shx, dbf=dbf, shapeType=shapefile.POINT if points else shapefile.POLYGON,
+                          encoding='utf-8') as writer:
+        writer.field('CODE', 'C', 14)
+        writer.field('GEOM_ACT_D', 'D')
+        writer.field('AREA_SCALE', 'N', 12, 0)
+        writer.field('OBJECTCODE', 'N', 10, 0)
+        for i in range(features):
+            if points:
+                writer.point(rnd.uniform(300000, 760000), rnd.uniform(170000, 450000))
+            else:
+                writer.poly(parcel(rnd))
+            writer.record(f'{territory}{i:010d}', f'{rnd.randint(1998, 2022)}{rnd.randint(1, 12):02}01',
+                          rnd.randint(1, 100000), rnd.choice([7201060110, 7201060210, 7201060310]))
+
+    for extension, f in (('shp', shp), ('shx', shx), ('dbf', dbf)):
+        archive.writestr(f'{territory}/{layer}.{extension}', f.getvalue())
+    archive.writestr(f'{territory}/{layer}.cpg', 'UTF-8')
+
+
+def generate_shapefiles(path, territories, features, seed=1):
+    """Writes territory zip archives with shapefiles of all KK* layers, returns file name => feature count"""
+    from kadastrs import LAYERS
+
+    rnd = random.Random(seed)
+    counts = {}
+    for territory in range(territories):
+        file_name = f'{territory + 1:04d}.zip'
+        with zipfile.ZipFile(os.path.join(path, file_name), 'w', zipfile.ZIP_DEFLATED) as archive:
+            for layer in LAYERS:
+                write_layer(archive, f'{territory + 1:04d}', layer, features, rnd)
+        counts[file_name] = features * len(LAYERS)
+
+    return counts
+
+
+if __name__ == '__main__':
+    args_parser = argparse.ArgumentParser(description='Generates synthetic VZD address CSV and cadastre XML files')
+    args_parser.add_argument('--houses', type=int, default=100000, help='Number of houses, defaults to 100000')
+    args_parser.add_argument('--items', type=int, default=50000, help='Number of items per XML file, defaults to 50000')
+    args_parser.add_argument('--territories', type=int, default=0,
+                             help='Number of cadastre shapefile archives, defaults to none')
+    args_parser.add_argument('--features', type=int, default=1000,
+                             help='Number of features per layer in each shapefile archive, defaults to 1000')
+    args_parser.add_argument('--seed', type=int, default=1)
+    args_parser.add_argument('path', help='Directory to write files to')
+    args = args_parser.parse_args()
+
+    os.makedirs(args.path, exist_ok=True)
+    counts = generate_addresses(args.path, args.houses, args.seed) | generate_metadata(args.path, args.items, args.seed)
+    if args.territories:
+        counts |= generate_shapefiles(args.path, args.territories, args.features, args.seed)
+    for file_name, count in counts.items():
+        print(f'{file_name}: {count} rows')
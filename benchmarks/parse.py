@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmarks parsing and conversion of a synthetic parcel metadata XML file (ParcelMetadataImporter.item_records) in the
+importing thread and with parse_workers processes, checking that records are the same and come in the same order.
+
+No database is needed, records are not written.
+
+Usage: python3 benchmarks/parse.py [--dataset Building] [--items 500000] [--workers 1,2,4,8] [--repeat 3]
+"""
+
+import argparse
+import functools
+import logging
+import os.path
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import defs  # noqa: E402
+from generate import datasets, generate_metadata  # noqa: E402
+
+
+def measure(name, items, repeat, run):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        records = run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{name:>12}: {items} items in {best:.2f}s, {items / best:,.0f} items/s')
+
+    return best, records
+
+
+if __name__ == '__main__':
+    args_parser = argparse.ArgumentParser(description='Benchmarks parallel parsing of parcel metadata XML files')
+    # Marks and ownerships importers read their lookup tables from the database
+    choices = [dataset for dataset in datasets if dataset not in ('Mark', 'Ownership')]
+    args_parser.add_argument('--dataset', choices=choices, default='Building',
+                             help='Dataset to generate, defaults to Building')
+    args_parser.add_argument('--items', type=int, default=500000, help='Number of items, defaults to 500000')
+    args_parser.add_argument('--workers', default='1,2,4,8', help='Comma separated worker counts, defaults to 1,2,4,8')
+    args_parser.add_argument('--chunk-bytes', type=int, default=defs.ParcelMetadataImporter.chunk_bytes)
+    args_parser.add_argument('--repeat', type=int, default=3)
+    args_parser.add_argument('--seed', type=int, default=1)
+    args = args_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        file_name = os.path.join(path, next(iter(generate_metadata(path, args.items, args.seed, only=[args.dataset]))))
+        importer_class = defs.get_file_importer(file_name)
+        print(f'{importer_class.__name__}, {os.path.getsize(file_name) / 1024 / 1024:.0f} MiB, {os.cpu_count()} CPUs')
+
+        def run(**options):
+            importer = importer_class(conn=None, file=file_name, logger=logging.getLogger(), **options)
+            return list(importer.item_records())
+
+        sequential, expected = measure('sequential', args.items, args.repeat, functools.partial(run, stream=True))
+        for workers in map(int, args.workers.split(',')):
+            elapsed, records = measure(f'{workers} worker(s)', args.items, args.repeat,
+                                       functools.partial(run, parse_workers=workers, chunk_bytes=args.chunk_bytes))
+            if records != expected:
+                raise RuntimeError(f'Records converted by {workers} worker(s) differ')
+            print(f'{"speedup":>12}: {sequential / elapsed:.2f}x')
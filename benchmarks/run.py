@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Benchmarks every importer in defs.py on synthetic data (see generate.py) against a throwaway PostgreSQL database.
+
+Database is created (and dropped afterwards, unless --keep is given) next to the one given by VZD_* environment
+variables, which has to be reachable and allow creating databases. PostGIS extension has to be available.
+
+Every importer runs in its own process, so that peak RSS is measured per importer. Wall time, rows/s, peak RSS, and
+number of queries are written to a JSON file, which can be compared with a result of another commit using --compare.
+
+Usage: VZD_DBNAME=postgres python3 benchmarks/run.py --houses 100000 --items 50000 --output before.json
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os.path
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from os import environ
+
+import psycopg2
+import psycopg2.extensions
+
+SCRIPT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPT_PATH)
+
+import defs  # noqa: E402
+from generate import generate_addresses, generate_metadata  # noqa: E402
+
+# Files in import order, address tables have to be imported before aw_eka, as it refreshes aw_full_addresses
+importers = [
+    ('aw_novads.csv', 'CountiesImporter'),
+    ('aw_pagasts.csv', 'ParishesImporter'),
+    ('aw_ciems.csv', 'VillagesImporter'),
+    ('aw_pilseta.csv', 'CitiesImporter'),
+    ('aw_iela.csv', 'StreetsImporter'),
+    ('aw_eka.csv', 'HousesImporter'),
+    ('mark.xml', 'MarksImporter'),
+    ('valuation.xml', 'ValuationsImporter'),
+    ('address.xml', 'ParcelAddressesImporter'),
+    ('ownership.xml', 'OwnershipsImporter'),
+    ('property.xml', 'PropertiesImporter'),
+    ('parcel.xml', 'ParcelsImporter'),
+    ('parcelpart.xml', 'ParcelPartsImporter'),
+    ('encumbrance.xml', 'EncumbrancesImporter'),
+    ('building.xml', 'BuildingsImporter'),
+    ('premisegroup.xml', 'PremiseGroupsImporter'),
+]
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """Counts statements sent to the server (execute_values sends one per page)"""
+    queries = 0
+
+    def execute(self, query, vars=None):
+        CountingCursor.queries += 1
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        CountingCursor.queries += len(vars_list)
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        CountingCursor.queries += 1
+        return super().copy_expert(sql, file, size)
+
+
+def connection_params(dbname):
+    params = {param: environ[f'VZD_{param.upper()}'] for param in ['user', 'password', 'host', 'port']
+              if f'VZD_{param.upper()}' in environ}
+
+    return {**params, 'dbname': dbname}
+
+
+def create_database(dbname):
+    conn = psycopg2.connect(**connection_params(environ.get('VZD_DBNAME', 'postgres')))
+    conn.autocommit = True
+    conn.cursor().execute(f'CREATE DATABASE {dbname}')
+    conn.close()
+
+    conn = psycopg2.connect(**connection_params(dbname))
+    with conn.cursor() as cur:
+        cur.execute('CREATE EXTENSION IF NOT EXISTS postgis')
+        with open(os.path.join(SCRIPT_PATH, 'schema.sql'), encoding='utf-8') as f:
+            cur.execute(f.read())
+    conn.commit()
+    conn.close()
+
+
+def drop_database(dbname):
+    conn = psycopg2.connect(**connection_params(environ.get('VZD_DBNAME', 'postgres')))
+    conn.autocommit = True
+    conn.cursor().execute(f'DROP DATABASE IF EXISTS {dbname}')
+    conn.close()
+
+
+def run_importer(params, importer_name, file_name, options, results):
+    """Runs in a child process, puts measurements into results queue"""
+    logger = logging.getLogger(importer_name)
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    conn = psycopg2.connect(**params, cursor_factory=CountingCursor)
+    importer = getattr(defs, importer_name)(conn=conn, file=file_name, logger=logger, **options)
+    started = time.perf_counter()
+    importer.process()
+    conn.commit()
+    wall = time.perf_counter() - started
+    conn.close()
+
+    results.put({
+        'wall': round(wall, 3),
+        'queries': CountingCursor.queries,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    })
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SCRIPT_PATH, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(path, dbname, counts, options):
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for file_name, importer_name in importers:
+        queue = context.Queue()
+        process = context.Process(target=run_importer, args=(
+            connection_params(dbname), importer_name, os.path.join(path, file_name), options, queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError(f'{importer_name} failed with exit code {process.exitcode}')
+
+        result = queue.get()
+        result = {'file': file_name, 'rows': counts[file_name],
+                  'rows_per_second': round(counts[file_name] / result['wall'] if result['wall'] else 0), **result}
+        results[importer_name] = result
+        print(f'{importer_name:>24}: {result["rows"]:>8} rows in {result["wall"]:>7.2f}s, '
+              f'{result["rows_per_second"]:>8} rows/s, {result["peak_rss_kb"] // 1024:>5} MiB, '
+              f'{result["queries"]:>7} queries')
+
+    return results
+
+
+def compare(previous, current):
+    print(f'Compared to {previous.get("commit") or "unknown commit"} ({previous.get("created")}):')
+    for importer_name, result in current['importers'].items():
+        before = previous.get('importers', {}).get(importer_name)
+        if not before:
+            print(f'{importer_name:>24}: no previous result')
+            continue
+        changes = []
+        for metric in ('wall', 'peak_rss_kb', 'queries'):
+            if before[metric]:
+                changes.append(f'{metric} {(result[metric] - before[metric]) / before[metric]:+.0%}')
+        print(f'{importer_name:>24}: {", ".join(changes)}')
+
+
+if __name__ == '__main__':
+    args_parser = argparse.ArgumentParser(description='Benchmarks importers on synthetic data')
+    args_parser.add_argument('--houses', type=int, default=100000, help='Number of houses, defaults to 100000')
+    args_parser.add_argument('--items', type=int, default=50000, help='Number of items per XML file, defaults to 50000')
+    args_parser.add_argument('--seed', type=int, default=1)
+    args_parser.add_argument('--bulk', action='store_true', help='Pass bulk option to importers')
+    args_parser.add_argument('--stream-xml', action='store_true', help='Pass stream option to importers')
+    args_parser.add_argument('--delta', action='store_true', help='Pass delta option to importers')
+    args_parser.add_argument('--parse-workers', type=int, default=0, help='Pass parse_workers option to importers')
+    args_parser.add_argument('--workdir', help='Directory for generated files, defaults to a temporary one')
+    args_parser.add_argument('--keep', action='store_true', help='Do not drop the benchmark database')
+    args_parser.add_argument('--output', default='benchmark.json', help='Result file, defaults to benchmark.json')
+    args_parser.add_argument('--compare', help='Previous result file to compare with')
+    args = args_parser.parse_args()
+
+    options = {'bulk': args.bulk, 'stream': args.stream_xml, 'delta': args.delta, 'parse_workers': args.parse_workers}
+    dbname = f'vzd_bench_{os.getpid()}'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.workdir or tmp
+        os.makedirs(path, exist_ok=True)
+        counts = generate_addresses(path, args.houses, args.seed) | generate_metadata(path, args.items, args.seed)
+
+        create_database(dbname)
+        try:
+            results = benchmark(path, dbname, counts, options)
+        finally:
+            if args.keep:
+                print(f'Keeping database {dbname}')
+            else:
+                drop_database(dbname)
+
+    report = {
+        'commit': git_commit(),
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'houses': args.houses,
+        'items': args.items,
+        'seed': args.seed,
+        'options': options,
+        'importers': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
@@ -0,0 +1,153 @@
+"""
+Columnar (Parquet or Arrow IPC) export of imported datasets, written from the importers' converted rows.
+
+pyarrow is an optional dependency, needed only when exporting.
+"""
+import os
+import shutil
+
+# Column types of importers (AddressesImporter.columns, etc) => pyarrow type factory names
+arrow_types = {
+    'int': 'int64',
+    'float': 'float64',
+    'bool': 'bool_',
+    'date': 'date32',
+    'string': 'string',
+}
+
+extensions = {
+    'parquet': 'parquet',
+    'arrow': 'arrow',
+}
+
+# Directory name of the partition of rows with NULL partition column, as in Hive (and understood by pyarrow.dataset)
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+class DatasetWriter:
+    """
+    Writes rows (tuples of values of columns) of a dataset into <path>/<dataset>/<partition>=<value>/part-0.<format>,
+    in record batches of batch_size rows per partition, with dictionary columns dictionary-encoded.
+
+    Files are written into <path>/<dataset>.tmp, and replace the previous export of the dataset once the writer has been
+    closed, so that readers never see a partially written dataset.
+    """
+
+    def __init__(self, path, dataset, columns, partition=None, dictionary=(), format='parquet', batch_size=65536):
+        import pyarrow
+
+        self.pa = pyarrow
+        self.path = path
+        self.dataset = dataset
+        self.names = list(columns)
+        self.partition = partition
+        self.partition_index = self.names.index(partition) if partition else None
+        self.format = format
+        self.batch_size = batch_size
+        self.target = os.path.join(path, dataset)
+        self.directory = f'{self.target}.tmp'
+        self.types = {}
+        for name, column_type in columns.items():
+            if name in dictionary:
+                self.types[name] = pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+            else:
+                self.types[name] = getattr(pyarrow, arrow_types[column_type])()
+        # Partition column is encoded in directory names only
+        self.schema = pyarrow.schema([(name, self.types[name]) for name in self.names if name != partition])
+        self.batches = {}
+        self.writers = {}
+        self.rows = 0
+        self.closed = False
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        elif not self.closed:
+            self.close()
+
+    def add(self, row):
+        key = row[self.partition_index] if self.partition else None
+        rows = self.batches.setdefault(key, [])
+        rows.append(row)
+        if len(rows) >= self.batch_size:
+            self.write(key)
+
+    def array(self, name, values):
+        column_type = self.types[name]
+        if self.pa.types.is_dictionary(column_type):
+            return self.pa.array(values, self.pa.string()).dictionary_encode()
+        elif self.pa.types.is_date(column_type):
+            # Dates are converted to ISO strings by importers, possibly followed by time (which is always midnight)
+            import pyarrow.compute
+
+            return pyarrow.compute.utf8_slice_codeunits(self.pa.array(values, self.pa.string()), 0, 10).cast(column_type)
+
+        return self.pa.array(values, column_type)
+
+    def writer(self, key):
+        if key not in self.writers:
+            directory = self.directory
+            if self.partition:
+                value = NULL_PARTITION if key is None else str(key)
+                directory = os.path.join(directory, f'{self.partition}={value}')
+                os.makedirs(directory, exist_ok=True)
+            file_name = os.path.join(directory, f'part-0.{extensions[self.format]}')
+
+            if self.format == 'arrow':
+                import pyarrow.ipc
+
+                self.writers[key] = pyarrow.ipc.new_file(file_name, self.schema)
+            else:
+                import pyarrow.parquet
+
+                self.writers[key] = pyarrow.parquet.ParquetWriter(file_name, self.schema, compression='zstd')
+
+        return self.writers[key]
+
+    def write(self, key):
+        rows = self.batches.pop(key, [])
+        if not rows:
+            return
+
+        columns = dict(zip(self.names, zip(*rows)))
+        batch = self.pa.RecordBatch.from_arrays([self.array(name, columns[name]) for name in self.schema.names],
+                                                schema=self.schema)
+        if self.format == 'arrow':
+            self.writer(key).write_batch(batch)
+        else:
+            self.writer(key).write_table(self.pa.Table.from_batches([batch]))
+        self.rows += len(rows)
+
+    def close(self):
+        """Writes remaining rows and replaces the previous export of the dataset"""
+        for key in list(self.batches):
+            self.write(key)
+        if not self.writers and not self.partition:
+            # Dataset without rows is still readable, with its schema
+            self.writer(None)
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+        previous = f'{self.target}.old'
+        shutil.rmtree(previous, ignore_errors=True)
+        if os.path.exists(self.target):
+            os.rename(self.target, previous)
+        os.rename(self.directory, self.target)
+        shutil.rmtree(previous, ignore_errors=True)
+        self.closed = True
+
+    def abort(self):
+        """Discards the files written, keeping the previous export of the dataset"""
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+        self.batches = {}
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.closed = True
@@ -1,105 +1,779 @@
+import collections
+import contextlib
 import csv
+import functools
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
 import os.path
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 import psycopg2
+import psycopg2.errors
 import psycopg2.extras
-from lxml import objectify
+from lxml import etree
+
+from metrics import TimedReader, exclusive, timed, timed_iter
+from pipeline import Pipeline
+
+
+class LocalFile:
+    """File on disk to be read by importers"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.size = os.path.getsize(path)
+        self.key = file_key(path)
+
+    def open(self):
+        return open(self.path, 'rb')
+
+    def digest(self):
+        digest = hashlib.sha256()
+        with self.open() as f:
+            while chunk := f.read(1024 * 1024):
+                digest.update(chunk)
+
+        return f'sha256:{digest.hexdigest()}'
+
+
+class ArchiveMember:
+    """Member of a zip archive to be read by importers straight from the archive, without extracting it to disk"""
+
+    def __init__(self, archive, info):
+        self.archive = archive
+        self.info = info
+        self.path = archive.filename
+        self.name = info.filename
+        self.size = info.file_size
+        self.key = f'{file_key(archive.filename)}|{info.filename}'
+
+    def open(self):
+        return self.archive.open(self.info)
+
+    def digest(self):
+        # CRC of the member is stored in the archive, and has been verified when the archive was downloaded
+        return f'crc32:{self.info.CRC:08x}:{self.size}'
+
+
+def file_key(path):
+    stat = os.stat(path)
+    return f'{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def as_source(file):
+    return file if isinstance(file, (LocalFile, ArchiveMember)) else LocalFile(file)
 
 
 class GenericImporter:
     conn = None
     file = None
+    source = None
     logger = None
-
-    def __init__(self, conn, file, logger):
+    # Seconds spent per stage and counters (rows read, written, etc), collected while processing
+    timings = {}
+    counters = {}
+    # Also export imported rows into a columnar file per dataset ('parquet' or 'arrow') in this directory
+    export_path = None
+    export_format = 'parquet'
+    # Column whose values partition the export, and columns to dictionary-encode
+    export_partition = None
+    export_dictionary = ()
+    # Read, parse and convert rows in a producer thread, while writing them in the importer's thread
+    pipelined = False
+    # Commit every commit_every rows (items of parcel metadata), recording progress in import_checkpoints
+    commit_every = 0
+    # Skip files imported completely, and continue partially imported ones from their last checkpoint
+    resume = False
+    checkpoint = None
+    # Id of the run to record inserted, updated and deleted keys (and changed values) under in vzd_changes, if any
+    changes = None
+    # Feed of rows of the file produced once for importers of the same file into several databases (see FanOut), if any
+    feed = None
+
+    def pipeline(self, rows):
+        """Returns rows handed over from a producer thread if pipelined (context manager, see Pipeline)"""
+        if self.pipelined and not self.feed:
+            return Pipeline(rows, self.timings)
+
+        # Rows of a feed are handed over from a producer thread already
+        return contextlib.nullcontext(rows)
+
+    def shared(self, produce, skip=0):
+        """Returns rows produced by produce(skip), or by the feed if given (skipping the first skip of them)"""
+        if not self.feed:
+            return produce(skip)
+
+        return itertools.islice(self.feed.items(produce, self.timings), skip, None)
+
+    def __init__(self, conn, file, logger, **options):
         self.conn = conn
         self.file = file
+        self.source = as_source(file)
         self.logger = logger
+        self.timings = {}
+        self.counters = {}
+
+        # Options not declared by the importer class are not applicable to it and are ignored
+        for name, value in options.items():
+            if hasattr(self, name):
+                setattr(self, name, value)
+
+    def open_source(self):
+        """Opens source for reading, accounting time spent reading (and decompressing) it to the read stage"""
+        return io.BufferedReader(TimedReader(self.source.open(), self.timings, self.counters))
+
+    def count(self, counter, value=1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def start_checkpoint(self):
+        """
+        Returns number of rows already committed by a previous import of the same file to be skipped, or None if the
+        file has been imported completely (and is to be skipped as a whole)
+        """
+        self.checkpoint = None
+        if not self.commit_every and not self.resume:
+            return 0
+
+        digest = self.source.digest()
+        with self.conn.cursor() as cur:
+            cur.execute('SELECT file_hash, rows, written, completed FROM import_checkpoints WHERE table_name = %s',
+                        (self.table,))
+            row = cur.fetchone()
+
+        self.checkpoint = {'file_hash': digest, 'rows': 0, 'written': 0, 'completed': False}
+        if self.resume and row and row[0] == digest:
+            if row[3]:
+                self.logger.info(f'{self.source.name} has already been imported into {self.table}, skipping')
+                return None
+            if self.can_resume(row[2]):
+                self.logger.info(f'Resuming import of {self.source.name} into {self.table} from row {row[1]}')
+                self.checkpoint |= {'rows': row[1], 'written': row[2]}
+            else:
+                self.logger.warning(f'Rows written to {self.table} do not match the checkpoint, starting over')
+
+        return self.checkpoint['rows']
+
+    def can_resume(self, written):
+        """Returns True if written rows recorded by the checkpoint are all there"""
+        return True
+
+    def save_checkpoint(self, cur, rows, written=None, completed=False):
+        """Records rows of the file read, and rows written (if given), as committed with the current transaction"""
+        if self.checkpoint is None:
+            return
+
+        self.checkpoint |= {'rows': rows, 'completed': completed} | ({'written': written} if written is not None else {})
+        cur.execute('INSERT INTO import_checkpoints (table_name, file_name, file_hash, rows, written, completed) '
+                    'VALUES (%(table)s, %(file_name)s, %(file_hash)s, %(rows)s, %(written)s, %(completed)s) '
+                    'ON CONFLICT (table_name) DO UPDATE SET file_name = EXCLUDED.file_name, '
+                    'file_hash = EXCLUDED.file_hash, rows = EXCLUDED.rows, written = EXCLUDED.written, '
+                    'completed = EXCLUDED.completed, updated_at = now()',
+                    self.checkpoint | {'table': self.table, 'file_name': self.source.name})
+
+    def save_changes(self, cur, changes):
+        """Records changes, as (operation, key, changed values) tuples, in vzd_changes"""
+        psycopg2.extras.execute_values(
+            cur, 'INSERT INTO vzd_changes (run_id, table_name, operation, key, changes) VALUES %s',
+            [(self.changes, self.table, operation, psycopg2.extras.Json(key),
+              psycopg2.extras.Json(values) if values is not None else None) for operation, key, values in changes],
+            page_size=1000)
+        self.count('changes', len(changes))
+
+    def stores_hashes(self):
+        """Returns True if the table has row_hash column, which writes have to keep up to date for --delta"""
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'row_hash' "
+                        "AND NOT attisdropped", (self.table,))
+            return cur.fetchone() is not None
+
+    def commit(self, cur, rows, written=None):
+        """Commits rows written so far, along with the checkpoint"""
+        self.save_checkpoint(cur, rows, written)
+        if self.conn.status == psycopg2.extensions.STATUS_BEGIN:
+            self.conn.commit()
+        self.logger.debug(f'{rows} rows of {self.source.name} committed')
+
+    def dataset_writer(self, columns):
+        """Returns writer of the columnar export of the table's rows (context manager, None if not exporting)"""
+        if not self.export_path:
+            return contextlib.nullcontext()
+        if self.checkpoint and self.checkpoint['rows']:
+            self.logger.warning(f'Not exporting {self.table}, as its import is being resumed')
+            return contextlib.nullcontext()
+
+        from columnar import DatasetWriter
+
+        return DatasetWriter(self.export_path, self.table, columns, partition=self.export_partition,
+                             dictionary=self.export_dictionary, format=self.export_format)
+
+
+class CopyStream(io.TextIOBase):
+    """Readable file-like object over an iterator of text lines, to be consumed by cursor.copy_expert()"""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line
+
+        if size < 0:
+            size = len(self.buffer)
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+
+        return chunk
+
+    @staticmethod
+    def format_value(value):
+        if value is None:
+            return '\\N'
+        elif value is True:
+            return 't'
+        elif value is False:
+            return 'f'
+
+        return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def convert_int(value):
+    return int(value) if value else None
+
+
+def convert_float(value):
+    return float(value) if value else None
+
+
+def convert_bool(value):
+    return value == 'Y' or value == '1'
+
+
+def convert_string(value):
+    return value if value else None
+
+
+date_iso_re = re.compile(r'^\d\d\d\d')
+date_dmy_re = re.compile(r'(\d\d)\.(\d\d)\.(\d\d\d\d)')
+
+
+@functools.lru_cache(maxsize=65536)
+def convert_date(value):
+    if not value:
+        return None
+
+    return value.replace('.', '-') if date_iso_re.match(value) else date_dmy_re.sub('\\3-\\2-\\1', value)
+
+
+column_converters = {
+    'int': convert_int,
+    'float': convert_float,
+    'bool': convert_bool,
+    'date': convert_date,
+    'string': convert_string,
+}
 
 
 class AddressesImporter(GenericImporter):
     geom = False
     table = None
     columns = {}
+    # Stream rows through COPY into an unlogged staging table and merge them with a single upsert
+    bulk = False
+    # Write only rows whose content hash has changed (implies loading through a staging table)
+    delta = False
+    counts = {}
+    # Record changed codes in aw_pending_changes, so that only affected rows of aw_full_addresses are recomputed
+    incremental_view = False
+    # Leave postprocess() to the caller, which runs it once all imports of postprocess_after classes are done
+    defer_postprocess = False
+    postprocess_after = ()
+    # 'merge' rows into the table in place, 'swap' in a fully loaded and indexed shadow copy of it, or 'auto' to swap
+    # if at least swap_fraction of rows have changed
+    strategy = 'merge'
+    swap_fraction = 0.3
+    maintenance_workers = 4
+    # Seconds renames wait for locks on the table (and dependent views) when swapping, and attempts to do so
+    swap_lock_timeout = 5
+    swap_attempts = 5
+    swapped = False
+    # Build geometry from 'latlng' (WGS 84 coordinates as published) or 'xy' (LKS-92 coordinates, transformed by PostGIS)
+    geom_source = 'latlng'
+    # Also store geometry in LKS-92 (EPSG:3059) in geom_3059 column
+    native_geom = False
+    export_partition = 'status'
+
+    @classmethod
+    def converters(cls):
+        """Returns a tuple of value converters, one per column, built once per importer class"""
+        if '_converters' not in cls.__dict__:
+            try:
+                cls._converters = tuple(column_converters[col_type] for col_type in cls.columns.values())
+            except KeyError as e:
+                raise RuntimeError(f'Unknown data type {e.args[0]}')
 
-    def iterator(self, reader):
+        return cls._converters
+
+    def iterator(self, reader, skip=0):
+        """Yields converted rows as tuples of column values, skipping the header (and the first skip rows)"""
+        row_converters = self.converters()
+        width = len(row_converters)
         for row in reader:
-            r = {}
-            for idx, column in enumerate(self.columns.keys()):
-                value = row[idx]
-                col_type = self.columns[column] if row[0] != '\ufeff#KODS#' and row[0] != '#KODS#' else 'string'
-                if not len(value) and col_type != 'bool':
-                    value = None
-                elif col_type == 'int':
-                    value = int(value)
-                elif col_type == 'float':
-                    value = float(value)
-                elif col_type == 'bool':
-                    value = {'Y': True, '1': True}.get(value, False)
-                elif col_type == 'date':
-                    value = value.replace('.', '-') if re.match(r'^\d\d\d\d', value) else re.sub(
-                        r'(\d\d)\.(\d\d)\.(\d\d\d\d)', '\\3-\\2-\\1', value)
-                elif col_type == 'string':
-                    pass
-                else:
-                    raise RuntimeError(f'Unknown data type {col_type}')
-                r[column] = value
-            yield r
+            if row[0] == '#KODS#' or row[0] == '\ufeff#KODS#':
+                continue
+            if skip:
+                skip -= 1
+                continue
+            if len(row) < width:
+                raise RuntimeError(f'Expected {width} columns, got {len(row)}')
+            yield tuple([convert(value) for convert, value in zip(row_converters, row)])
+
+    def rows(self, skip=0):
+        """Yields converted rows of the file (see iterator)"""
+        with io.TextIOWrapper(self.open_source(), encoding='utf-8', newline='') as file:
+            # Stages run interleaved, each of them timed inclusive of the ones it pulls rows from
+            rows = timed_iter(csv.reader(file, delimiter=";", quotechar='#'), self.timings, 'parse')
+            yield from timed_iter(self.iterator(rows, skip), self.timings, 'convert')
+
+    def exported(self, reader, writer):
+        """Passes rows through, adding the ones to be imported to the columnar export"""
+        lng = self.coordinate_index()
+        for row in reader:
+            if not self.geom or row[lng] is not None:
+                writer.add(row)
+            yield row
 
     def process(self):
+        started = time.monotonic()
+        self.counts = {}
+        self.swapped = False
+        offset = self.start_checkpoint()
+        if offset is None:
+            return
+
+        with self.conn.cursor() as cur, self.dataset_writer(self.columns) as writer:
+            self.logger.debug("Reading CSV file")
+            reader = self.shared(self.rows, offset)
+            if writer:
+                reader = timed_iter(self.exported(reader, writer), self.timings, 'export')
+            nested = self.timings.get('index', 0) + self.timings.get('swap', 0)
+            with self.pipeline(reader) as reader, timed(self.timings, 'write'):
+                if self.staged():
+                    i = self.copy_rows(cur, reader, offset)
+                else:
+                    self.drop_geom_indexes(cur)
+                    i = self.insert_rows(cur, reader, offset)
+                self.save_checkpoint(cur, i, completed=True)
+            # Indexes are dropped (and built and swapped in, when swapping) while writing
+            self.timings['write'] -= self.timings.get('index', 0) + self.timings.get('swap', 0) - nested
+            if self.pipelined or self.feed:
+                # Rows are produced in another thread, concurrently with writing (which includes waiting for them)
+                exclusive(self.timings, ('read', 'parse', 'convert', 'export'))
+                exclusive(self.timings, ('writer_stall', 'write'))
+            else:
+                exclusive(self.timings, ('read', 'parse', 'convert', 'export', 'write'))
+            self.count('rows_read', i - offset)
+            self.count('rows_written', self.counts.get('inserted', 0) + self.counts.get('updated', 0)
+                       if self.delta else i - self.counters.get('rows_skipped', 0))
+            if writer:
+                with timed(self.timings, 'export'):
+                    writer.close()
+                self.count('rows_exported', writer.rows)
+
+            if self.incremental_view and not self.delta and not self.swapped:
+                # Every row has been rewritten, there is no telling which of them have changed
+                with timed(self.timings, 'write'):
+                    cur.execute('INSERT INTO aw_pending_changes (table_name, code) VALUES (%s, NULL)', (self.table,))
+
+            if not self.swapped:
+                self.create_geom_indexes(cur)
+
+            elapsed = time.monotonic() - started
+            self.logger.info(f'{i - offset} rows loaded into {self.table} in {elapsed:.1f}s '
+                             f'({(i - offset) / elapsed if elapsed else 0:.0f} rows/s)')
+
+            if not self.defer_postprocess:
+                self.postprocess()
+
+    def geom_columns(self, ref):
+        """Returns geometry column => SQL expression building it from coordinate columns referenced by ref(column)"""
+        if not self.geom:
+            return {}
+
+        # LKS-92 X axis points north and Y east, so X is the point's Y
+        lks92 = f'ST_SetSRID(ST_MakePoint({ref("y")}, {ref("x")}), 3059)'
+        columns = {
+            'geom': f'ST_Transform({lks92}, 4326)' if self.geom_source == 'xy' else
+            f'ST_SetSRID(ST_MakePoint({ref("lng")}, {ref("lat")}), 4326)',
+        }
+        if self.native_geom:
+            columns['geom_3059'] = lks92
+
+        return columns
+
+    def drop_geom_indexes(self, cur):
+        for column in self.geom_columns(str):
+            self.logger.debug(f'Dropping {column} index')
+            with timed(self.timings, 'index'):
+                cur.execute(f'DROP INDEX IF EXISTS {self.table}_{column}_idx')
+
+    def create_geom_indexes(self, cur):
+        for column in self.geom_columns(str):
+            self.logger.debug(f'Creating {column} index')
+            with timed(self.timings, 'index'):
+                cur.execute(f'CREATE INDEX {self.table}_{column}_idx ON {self.table} USING GIST ({column})')
+
+    def coordinate_index(self):
+        return list(self.columns.keys()).index('lng') if self.geom else None
+
+    def staged(self):
+        """Returns True if rows are loaded through a staging table"""
+        return self.bulk or self.delta or self.changes or self.strategy != 'merge'
+
+    def can_resume(self, written):
         with self.conn.cursor() as cur:
+            if self.staged():
+                cur.execute('SELECT to_regclass(%s)', (f'{self.table}_staging',))
+                if cur.fetchone()[0] is None:
+                    return False
+                cur.execute(f'SELECT count(*) FROM {self.table}_staging')
+            else:
+                # Rows which have been written by the interrupted import are marked as updated
+                cur.execute(f'SELECT count(*) FROM {self.table} WHERE updated')
+
+            return cur.fetchone()[0] == written
+
+    def insert_rows(self, cur, reader, offset=0):
+        if not offset:
             cur.execute(f'UPDATE {self.table} SET updated = False')
-            if self.geom:
-                self.logger.debug('Dropping geom index')
-                cur.execute(f'DROP INDEX IF EXISTS {self.table}_geom_idx')
 
-            self.logger.debug("Reading CSV file")
-            with open(self.file, 'r+') as file:
-                reader = self.iterator(csv.reader(file, delimiter=";", quotechar='#'))
-                # Skip header
-                next(reader)
-                columns = list(self.columns.keys())
-                placeholders = ["%s"] * len(columns);
-                if self.geom:
-                    columns.append('geom')
-                    placeholders.append('ST_GeomFromText(%s, 4326)')
-
-                self.logger.debug(f'Inserting rows')
-
-                i = 0
-                for row in reader:
-                    i += 1
-                    values = list(row.values())
-                    if self.geom:
-                        if row['lng'] is None:
-                            continue
-                        values.append('POINT(%s %s)' % (row['lng'], row['lat']))
-
-                    sets = ', '.join(f'{column} = {placeholder}' for column, placeholder in
-                                     zip(columns + ['updated'], placeholders + ['True']))
-                    sql = f'INSERT INTO {self.table} ({", ".join(columns)}, updated) VALUES ({", ".join(placeholders)}, true) ON CONFLICT (code) DO UPDATE SET {sets}'
-                    try:
-                        cur.execute(sql, values * 2)
-                    except Exception as e:
-                        self.logger.error(f'Error inserting row {i}')
-                        self.logger.error(e)
-                        self.logger.error(sql)
-                        raise e
-                    if i % 10000 == 0:
-                        self.logger.debug(f'{i} rows inserted')
+        names = list(self.columns.keys())
+        values = {column: f'%({column})s' for column in names} | self.geom_columns(lambda column: f'%({column})s')
+        sets = ', '.join(f'{column} = EXCLUDED.{column}' for column in values)
+        # Hashes of rewritten rows are not computed here, they are reset so that --delta writes those rows again
+        if self.stores_hashes():
+            sets += ', row_hash = NULL'
+        sql = f'INSERT INTO {self.table} ({", ".join(values)}, updated) VALUES ({", ".join(values.values())}, true) ' \
+              f'ON CONFLICT (code) DO UPDATE SET {sets}, updated = true'
 
-                self.logger.debug(f'{i} rows inserted')
+        self.logger.debug(f'Inserting rows')
 
-            if self.geom:
-                self.logger.debug('Creating geom index')
-                cur.execute(f'CREATE INDEX {self.table}_geom_idx ON {self.table} USING GIST (geom)')
+        lng = self.coordinate_index()
+        i = offset
+        written = self.checkpoint['written'] if offset else 0
+        for row in reader:
+            i += 1
+            if self.geom and row[lng] is None:
+                self.count('rows_skipped')
+            else:
+                try:
+                    cur.execute(sql, dict(zip(names, row)))
+                    written += 1
+                except Exception as e:
+                    self.logger.error(f'Error inserting row {i}')
+                    self.logger.error(e)
+                    self.logger.error(sql)
+                    raise e
+            if i % 10000 == 0:
+                self.logger.debug(f'{i} rows inserted')
+            if self.commit_every and i % self.commit_every == 0:
+                self.commit(cur, i, written)
+
+        self.logger.debug(f'{i} rows inserted')
+
+        self.logger.debug('Cleaning up')
+        cur.execute(f'DELETE FROM {self.table} WHERE updated = False')
+        self.logger.debug("Done")
+        if self.checkpoint:
+            self.checkpoint['written'] = written
+
+        return i
+
+    def copy_rows(self, cur, reader, offset=0):
+        staging = f'{self.table}_staging'
+        columns = list(self.columns.keys())
+        # Target column => value built from staged columns, geometries are built from staged coordinates in SQL
+        values = {column: f's.{column}' for column in columns} | self.geom_columns(lambda column: f's.{column}')
+
+        if not offset:
+            self.logger.debug(f'Creating staging table {staging}')
+            cur.execute(f'DROP TABLE IF EXISTS {staging}')
+            cur.execute(f'CREATE UNLOGGED TABLE {staging} (LIKE {self.table} INCLUDING DEFAULTS)')
+
+        lng = self.coordinate_index()
+        counter = {'rows': offset}
+        staged = self.checkpoint['written'] if offset else 0
+
+        def lines(reader):
+            for row in reader:
+                counter['rows'] += 1
+                if self.geom and row[lng] is None:
+                    self.count('rows_skipped')
+                    continue
+                yield '\t'.join(CopyStream.format_value(value) for value in row) + '\n'
+
+                if counter['rows'] % 10000 == 0:
+                    self.logger.debug(f'{counter["rows"]} rows copied')
+
+        self.logger.debug(f'Copying rows into {staging}')
+        reader = iter(reader)
+        while True:
+            # Rows are copied commit_every rows at a time, each batch in a transaction of its own
+            before = counter['rows']
+            chunk = itertools.islice(reader, self.commit_every) if self.commit_every else reader
+            cur.copy_expert(f'COPY {staging} ({", ".join(columns)}) FROM STDIN', CopyStream(lines(chunk)))
+            staged += cur.rowcount
+            if not self.commit_every or counter['rows'] - before < self.commit_every:
+                break
+            self.commit(cur, counter['rows'], staged)
+        self.logger.debug(f'{counter["rows"]} rows copied')
+        if self.checkpoint:
+            self.checkpoint['written'] = staged
+
+        if self.changes:
+            self.record_changes(cur, staging)
+
+        if self.strategy != 'merge' and self.should_swap(cur, staging):
+            self.swap(cur, staging, values)
+        elif self.delta:
+            self.drop_geom_indexes(cur)
+            self.logger.debug(f'Merging {staging} into {self.table}')
+            self.merge_delta(cur, staging, values)
+        else:
+            self.drop_geom_indexes(cur)
+            self.logger.debug(f'Merging {staging} into {self.table}')
+            if self.stores_hashes():
+                # Hashes are kept up to date, so that a later --delta import compares rows with what is stored
+                values = values | {'row_hash': self.hash_expression()}
+            sets = ', '.join(f'{column} = EXCLUDED.{column}' for column in values)
+            cur.execute(f'INSERT INTO {self.table} ({", ".join(values)}, updated) '
+                        f'SELECT {", ".join(values.values())}, true FROM {staging} s '
+                        f'ON CONFLICT (code) DO UPDATE SET {sets}, updated = true')
 
             self.logger.debug('Cleaning up')
-            cur.execute(f'DELETE FROM {self.table} WHERE updated = False')
-            self.logger.debug("Done")
-
-            self.postprocess()
+            cur.execute(f'DELETE FROM {self.table} t '
+                        f'WHERE NOT EXISTS (SELECT 1 FROM {staging} s WHERE s.code = t.code)')
+        cur.execute(f'DROP TABLE {staging}')
+        self.logger.debug("Done")
+
+        return counter['rows']
+
+    def should_swap(self, cur, staging):
+        """Compares staged rows with the table, returns True if they are to be swapped in instead of merged"""
+        cur.execute(f'ANALYZE {staging}')
+
+        # A view can be rebound to the new table, a materialized view would have to be recreated
+        cur.execute("SELECT DISTINCT c.oid::regclass::text FROM pg_depend d "
+                    "JOIN pg_rewrite r ON r.oid = d.objid JOIN pg_class c ON c.oid = r.ev_class "
+                    "WHERE d.classid = 'pg_rewrite'::regclass AND d.refobjid = %s::regclass "
+                    "AND c.oid <> d.refobjid AND c.relkind <> 'v'", (self.table,))
+        dependent = [row[0] for row in cur.fetchall()]
+        if dependent:
+            self.logger.warning(f'Not swapping {self.table}, as {", ".join(dependent)} depend(s) on it')
+            return False
+
+        if self.strategy == 'swap' and not self.delta:
+            return True
+
+        cur.execute(f'SELECT count(*) FILTER (WHERE t.code IS NULL), '
+                    f'count(*) FILTER (WHERE s.code IS NOT NULL AND t.code IS NOT NULL '
+                    f'AND ROW({", ".join(f"s.{column}" for column in self.columns.keys())}) IS DISTINCT FROM '
+                    f'ROW({", ".join(f"t.{column}" for column in self.columns.keys())})), '
+                    f'count(*) FILTER (WHERE s.code IS NULL), count(s.code), count(t.code) '
+                    f'FROM {staging} s FULL JOIN {self.table} t ON t.code = s.code')
+        inserted, updated, deleted, staged, total = cur.fetchone()
+        self.counts = {'inserted': inserted, 'updated': updated, 'unchanged': staged - inserted - updated,
+                       'deleted': deleted}
+        fraction = (inserted + updated + deleted) / total if total else 1
+        self.logger.debug(f'{inserted} new, {updated} changed, {deleted} missing row(s), {fraction:.0%} of {total}')
+
+        return self.strategy == 'swap' or fraction >= self.swap_fraction
+
+    def swap(self, cur, staging, values):
+        """
+        Loads staged rows into a shadow copy of the table, builds its indexes, and renames it into place.
+
+        Live table is neither locked nor left without indexes while loading. The swap (renames, rebinding dependent
+        views, dropping the old table) is committed along with the rest of the import, and is serialized with swaps of
+        other tables, which may rebind the same views.
+        """
+        shadow = f'{self.table}_shadow'
+        self.logger.info(f'Loading {self.table} into {shadow}')
+        cur.execute(f'DROP TABLE IF EXISTS {shadow}')
+        cur.execute(f'CREATE TABLE {shadow} (LIKE {self.table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        self.copy_privileges(cur, shadow)
+
+        if self.delta or self.stores_hashes():
+            values = values | {'row_hash': self.hash_expression()}
+        cur.execute(f'INSERT INTO {shadow} ({", ".join(values)}, updated) '
+                    f'SELECT {", ".join(values.values())}, true FROM {staging} s')
+
+        cur.execute('SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s',
+                    (self.table,))
+        indexes = cur.fetchall()
+        cur.execute("SELECT conname, conindid::regclass::text, contype FROM pg_constraint "
+                    "WHERE conrelid = %s::regclass AND contype IN ('p', 'u')", (self.table,))
+        constraints = cur.fetchall()
+
+        with timed(self.timings, 'index'):
+            cur.execute(f'SET LOCAL max_parallel_maintenance_workers = {int(self.maintenance_workers)}')
+            for name, definition in indexes:
+                self.logger.debug(f'Creating index {name}_shadow')
+                cur.execute(re.sub(rf' INDEX {name} ON (\S+\.)?{self.table} ', f' INDEX {name}_shadow ON {shadow} ',
+                                   definition, count=1))
+            for name, index, kind in constraints:
+                cur.execute(f'ALTER TABLE {shadow} ADD CONSTRAINT {name}_shadow '
+                            f'{"PRIMARY KEY" if kind == "p" else "UNIQUE"} USING INDEX {index}_shadow')
+            cur.execute(f'ANALYZE {shadow}')
+
+        # Held until the import is committed, so that concurrent swaps do not deadlock rebinding the same views
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('vzd swap'))")
+
+        # Views are rebound to the shadow table by redefining them with the same text
+        cur.execute("SELECT DISTINCT c.oid::regclass::text, pg_get_viewdef(c.oid) FROM pg_depend d "
+                    "JOIN pg_rewrite r ON r.oid = d.objid JOIN pg_class c ON c.oid = r.ev_class "
+                    "WHERE d.classid = 'pg_rewrite'::regclass AND d.refobjid = %s::regclass AND c.oid <> d.refobjid",
+                    (self.table,))
+        views = cur.fetchall()
+
+        self.logger.info(f'Swapping {shadow} into {self.table}')
+        with timed(self.timings, 'swap'):
+            # Renames wait for readers of the table (and views) for a while only, instead of queueing new readers
+            # behind them, and are retried from the savepoint
+            cur.execute('SAVEPOINT swap')
+            for attempt in range(1, self.swap_attempts + 1):
+                cur.execute('SET LOCAL lock_timeout = %s', (f'{self.swap_lock_timeout}s',))
+                try:
+                    self.rename_shadow(cur, shadow, views, indexes, constraints)
+                    break
+                except psycopg2.errors.LockNotAvailable:
+                    cur.execute('ROLLBACK TO SAVEPOINT swap')
+                    if attempt == self.swap_attempts:
+                        raise
+                    self.logger.warning(f'{self.table} is in use, retrying swap ({attempt} of {self.swap_attempts})')
+                    time.sleep(attempt)
+            cur.execute('RELEASE SAVEPOINT swap')
+            cur.execute('SET LOCAL lock_timeout = DEFAULT')
+        self.swapped = True
+
+        if self.delta:
+            self.count('rows_unchanged', self.counts['unchanged'])
+            self.count('rows_deleted', self.counts['deleted'])
+            self.logger.info(f'{self.table}: {self.counts["inserted"]} inserted, {self.counts["updated"]} updated, '
+                             f'{self.counts["unchanged"]} unchanged, {self.counts["deleted"]} deleted')
+
+    def rename_shadow(self, cur, shadow, views, indexes, constraints):
+        """Renames shadow table (and its indexes and constraints) into place, rebinding views, dropping the old one"""
+        cur.execute(f'ALTER TABLE {self.table} RENAME TO {self.table}_old')
+        cur.execute(f'ALTER TABLE {shadow} RENAME TO {self.table}')
+        for view, definition in views:
+            cur.execute(f'CREATE OR REPLACE VIEW {view} AS {definition}')
+        cur.execute(f'DROP TABLE {self.table}_old')
+        for name, _, _ in constraints:
+            cur.execute(f'ALTER TABLE {self.table} RENAME CONSTRAINT {name}_shadow TO {name}')
+        for name, _ in indexes:
+            if name not in {index for _, index, _ in constraints}:
+                cur.execute(f'ALTER INDEX {name}_shadow RENAME TO {name}')
+        if self.incremental_view:
+            cur.execute('INSERT INTO aw_pending_changes (table_name, code) VALUES (%s, NULL)', (self.table,))
+
+    def copy_privileges(self, cur, shadow):
+        """Gives shadow table the owner of the table, and privileges granted on the table and its columns"""
+        cur.execute('SELECT quote_ident(pg_get_userbyid(relowner)) FROM pg_class '
+                    'WHERE oid = %s::regclass AND pg_get_userbyid(relowner) <> current_user', (self.table,))
+        owner = cur.fetchone()
+        if owner:
+            cur.execute(f'ALTER TABLE {shadow} OWNER TO {owner[0]}')
+
+        grantee = "CASE WHEN a.grantee = 0 THEN 'PUBLIC' ELSE quote_ident(pg_get_userbyid(a.grantee)) END"
+        cur.execute(f'SELECT a.privilege_type, NULL, {grantee}, a.is_grantable '
+                    f'FROM pg_class c CROSS JOIN LATERAL aclexplode(c.relacl) a WHERE c.oid = %(table)s::regclass '
+                    f'UNION ALL '
+                    f'SELECT a.privilege_type, quote_ident(t.attname), {grantee}, a.is_grantable '
+                    f'FROM pg_attribute t CROSS JOIN LATERAL aclexplode(t.attacl) a '
+                    f'WHERE t.attrelid = %(table)s::regclass AND NOT t.attisdropped', {'table': self.table})
+        for privilege, column, grantee, grantable in cur.fetchall():
+            cur.execute(f'GRANT {privilege}{f" ({column})" if column else ""} ON {shadow} TO {grantee}'
+                        f'{" WITH GRANT OPTION" if grantable else ""}')
+
+    def hash_expression(self):
+        """Returns SQL expression of the content hash of a staged row (aliased s)"""
+        return f'md5(ROW({", ".join(f"s.{column}" for column in self.columns.keys())})::text)'
+
+    def merge_delta(self, cur, staging, values):
+        """Writes only rows whose content hash differs from the stored one, deletes only codes which are missing"""
+        row_hash = self.hash_expression()
+
+        self.counts['deleted'] = self.execute_tracked(
+            cur,
+            f'DELETE FROM {self.table} t WHERE NOT EXISTS (SELECT 1 FROM {staging} s WHERE s.code = t.code)',
+            't.code')
+
+        sets = ', '.join(f'{column} = {value}' for column, value in values.items())
+        self.counts['updated'] = self.execute_tracked(
+            cur,
+            f'UPDATE {self.table} t SET {sets}, row_hash = {row_hash} FROM {staging} s '
+            f'WHERE s.code = t.code AND t.row_hash IS DISTINCT FROM {row_hash}',
+            't.code')
+
+        self.counts['inserted'] = self.execute_tracked(
+            cur,
+            f'INSERT INTO {self.table} ({", ".join(values)}, row_hash, updated) '
+            f'SELECT {", ".join(values.values())}, {row_hash}, true FROM {staging} s '
+            f'WHERE NOT EXISTS (SELECT 1 FROM {self.table} t WHERE t.code = s.code)',
+            f'{self.table}.code')
+
+        cur.execute(f'SELECT count(*) FROM {staging}')
+        self.counts['unchanged'] = cur.fetchone()[0] - self.counts['updated'] - self.counts['inserted']
+        self.count('rows_unchanged', self.counts['unchanged'])
+        self.count('rows_deleted', self.counts['deleted'])
+
+        self.logger.info(f'{self.table}: {self.counts["inserted"]} inserted, {self.counts["updated"]} updated, '
+                         f'{self.counts["unchanged"]} unchanged, {self.counts["deleted"]} deleted')
+
+    def record_changes(self, cur, staging):
+        """Records codes which are new, changed (with new values of changed columns) or missing from staged rows"""
+        def values(alias):
+            return f'jsonb_build_object({", ".join(f"{column!r}, {alias}.{column}" for column in self.columns)})'
+
+        columns = ', '.join(self.columns)
+        cur.execute(f"""
+            INSERT INTO vzd_changes (run_id, table_name, operation, key, changes)
+            SELECT %s, %s,
+                   CASE WHEN t.code IS NULL THEN 'insert' WHEN s.code IS NULL THEN 'delete' ELSE 'update' END,
+                   jsonb_build_object('code', coalesce(s.code, t.code)),
+                   CASE WHEN t.code IS NULL THEN v.new WHEN s.code IS NOT NULL THEN
+                       (SELECT jsonb_object_agg(n.key, n.value) FROM jsonb_each(v.new) n
+                        WHERE n.value IS DISTINCT FROM v.old -> n.key) END
+            FROM {staging} s FULL JOIN {self.table} t ON t.code = s.code
+            CROSS JOIN LATERAL (SELECT {values('s')} AS new, {values('t')} AS old) v
+            WHERE t.code IS NULL OR s.code IS NULL OR ROW(s.{columns.replace(', ', ', s.')}) IS DISTINCT FROM
+                  ROW(t.{columns.replace(', ', ', t.')})
+            ORDER BY coalesce(s.code, t.code)""", (self.changes, self.table))
+        self.count('changes', cur.rowcount)
+        self.logger.debug(f'{cur.rowcount} change(s) of {self.table} recorded')
+
+    def execute_tracked(self, cur, sql, returning):
+        """Executes data modifying statement, recording affected codes if incremental view maintenance is enabled"""
+        if self.incremental_view:
+            cur.execute(f'WITH changed AS ({sql} RETURNING {returning} AS code) '
+                        f'INSERT INTO aw_pending_changes (table_name, code) SELECT %s, code FROM changed',
+                        (self.table,))
+        else:
+            cur.execute(sql)
+
+        return cur.rowcount
 
     def postprocess(self):
         pass
@@ -230,222 +904,825 @@ class HousesImporter(AddressesImporter):
         'lat': 'float',
         'lng': 'float',
     }
+    export_dictionary = ('postal_code',)
     geom = True
+    # aw_full_addresses joins all address tables
+    postprocess_after = (AddressesImporter,)
+    # Share of houses affected by changes, above which aw_full_addresses table is rebuilt as a whole
+    full_rebuild_fraction = 0.2
 
     def postprocess(self):
-        try:
-            with self.conn.cursor() as cur:
-                cur.execute('SELECT 1 FROM aw_full_addresses LIMIT 1')
-                self.logger.info('Refreshing materialized view aw_full_addresses')
-                cur.execute('REFRESH MATERIALIZED VIEW aw_full_addresses')
-                self.logger.debug('Refreshed materialized view aw_full_addresses')
-        except psycopg2.Error as e:
-            self.logger.debug('No materialized view to refresh')
+        with self.conn.cursor() as cur, timed(self.timings, 'refresh_view'):
+            cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('aw_full_addresses')")
+            kind = cur.fetchone()
+            if kind is None:
+                self.logger.debug('No materialized view to refresh')
+            elif kind[0] == 'm':
+                self.refresh_view(cur)
+            else:
+                self.update_view(cur)
+
+            if self.incremental_view:
+                cur.execute('DELETE FROM aw_pending_changes')
+
+    def refresh_view(self, cur):
+        # Concurrent refresh does not lock out readers, but requires a unique index and an already populated view
+        cur.execute("SELECT m.ispopulated AND EXISTS (SELECT 1 FROM pg_index i "
+                    "WHERE i.indrelid = 'aw_full_addresses'::regclass AND i.indisunique) "
+                    "FROM pg_matviews m WHERE m.matviewname = 'aw_full_addresses'")
+        concurrently = cur.fetchone()[0]
+
+        self.logger.info(f'Refreshing materialized view aw_full_addresses{" concurrently" if concurrently else ""}')
+        cur.execute(f'REFRESH MATERIALIZED VIEW {"CONCURRENTLY " if concurrently else ""}aw_full_addresses')
+        self.logger.debug('Refreshed materialized view aw_full_addresses')
+
+    def update_view(self, cur):
+        """Maintains aw_full_addresses table, recomputing only rows of houses affected by pending changes"""
+        pending = None
+        if self.incremental_view:
+            cur.execute('SELECT count(*), count(*) FILTER (WHERE code IS NULL) FROM aw_pending_changes')
+            pending, unknown = cur.fetchone()
+            if not pending:
+                self.logger.debug('No changes affecting aw_full_addresses')
+                return
+            if unknown:
+                pending = None
+
+        if pending is not None:
+            # Houses which have changed themselves, or are (transitively) within a changed street, village, town,
+            # parish or county
+            cur.execute('DROP TABLE IF EXISTS aw_affected')
+            cur.execute("""
+                CREATE TEMPORARY TABLE aw_affected ON COMMIT DROP AS
+                WITH RECURSIVE areas(code) AS (
+                    SELECT code FROM aw_pending_changes
+                    UNION
+                    SELECT child.code
+                    FROM (SELECT code, parent_code FROM aw_iela
+                          UNION ALL SELECT code, parent_code FROM aw_ciems
+                          UNION ALL SELECT code, parent_code FROM aw_pilseta
+                          UNION ALL SELECT code, parent_code FROM aw_pagasts) child
+                    JOIN areas ON child.parent_code = areas.code
+                )
+                SELECT code FROM aw_pending_changes WHERE table_name = 'aw_eka'
+                UNION
+                SELECT e.code FROM aw_eka e JOIN areas ON e.parent_code = areas.code
+                """)
+            affected = cur.rowcount
+            cur.execute('SELECT count(*) FROM aw_eka')
+            if affected > cur.fetchone()[0] * self.full_rebuild_fraction:
+                self.logger.debug(f'{affected} houses affected, rebuilding aw_full_addresses')
+                pending = None
+
+        if pending is None:
+            self.logger.info('Rebuilding aw_full_addresses')
+            cur.execute('DELETE FROM aw_full_addresses')
+            cur.execute('INSERT INTO aw_full_addresses SELECT * FROM aw_full_addresses_source')
+        else:
+            self.logger.info(f'Updating {affected} house(s) in aw_full_addresses')
+            cur.execute('DELETE FROM aw_full_addresses WHERE code IN (SELECT code FROM aw_affected)')
+            cur.execute('INSERT INTO aw_full_addresses '
+                        'SELECT * FROM aw_full_addresses_source WHERE code IN (SELECT code FROM aw_affected)')
+        self.logger.debug(f'{cur.rowcount} row(s) written to aw_full_addresses')
+
+
+class ItemMapping:
+    """
+    Maps *ItemData elements to records. fields are column => (path, type) of the item's values, record_fields the same
+    for values of every element at records path, relative to it (one record per element, e.g. marks of an object,
+    numbered from 1 in ordinal column, if given). Paths are dot separated element names, types are those of
+    AddressesImporter.columns.
+
+    Paths are compiled once (per namespace) into trees of element tags, which are walked along with the item's children
+    in a single pass, instead of looking up every path separately.
+    """
+
+    def __init__(self, fields, records=None, record_fields=None, ordinal=None):
+        self.fields = fields
+        self.records_path = records
+        self.record_fields = record_fields or {}
+        self.ordinal = ordinal
+        self.columns = {column: column_type for column, (_, column_type) in (fields | self.record_fields).items()}
+        if ordinal:
+            self.columns[ordinal] = 'int'
+        self.compiled = {}
+
+    @staticmethod
+    def tree(fields, namespace):
+        """Returns tag => (list of (column, converter) of the element's text, subtree of its children)"""
+        tree = {}
+        for column, (path, column_type) in fields.items():
+            children = tree
+            for name in path.split('.'):
+                node = children.setdefault(namespace + name, ([], {}))
+                children = node[1]
+            node[0].append((column, column_converters[column_type]))
+
+        return tree
+
+    def compile(self, namespace):
+        tags = [namespace + name for name in self.records_path.split('.')] if self.records_path else None
+        return self.tree(self.fields, namespace), tags, self.tree(self.record_fields, namespace)
+
+    @classmethod
+    def walk(cls, element, tree, values):
+        """Sets values of columns found under element, the first one of each of them"""
+        for child in element.iterchildren():
+            node = tree.get(child.tag)
+            if node is None:
+                continue
+            columns, children = node
+            for column, convert in columns:
+                if values[column] is None:
+                    values[column] = convert(child.text)
+            if children:
+                cls.walk(child, children, values)
+
+    @classmethod
+    def elements(cls, element, tags):
+        """Yields elements at the path of tags under element"""
+        for child in element.iterchildren(tags[0]):
+            if len(tags) == 1:
+                yield child
+            else:
+                yield from cls.elements(child, tags[1:])
+
+    def records(self, item):
+        """Returns records of item, as a list of dicts"""
+        namespace = item.tag[:item.tag.rfind('}') + 1]
+        if namespace not in self.compiled:
+            self.compiled[namespace] = self.compile(namespace)
+        tree, tags, record_tree = self.compiled[namespace]
+
+        base = dict.fromkeys(self.fields)
+        self.walk(item, tree, base)
+        if tags is None:
+            return [base]
+
+        records = []
+        for i, element in enumerate(self.elements(item, tags), 1):
+            record = base | dict.fromkeys(self.record_fields)
+            self.walk(element, record_tree, record)
+            if self.ordinal:
+                record[self.ordinal] = i
+            records.append(record)
+
+        return records
 
 
 class ParcelMetadataImporter(GenericImporter):
     table = None
-    pkey = True
-    props = {}
-    base = {}
+    # Columns identifying a record (primary key of the table), records without key are appended instead of upserted
+    key = ('cadastre_nr',)
+    # Mapping of *ItemData elements to records (see ItemMapping): the object's relation, fields of the item, and fields
+    # of every element at records path (with ordinal column numbering them)
+    relation_fields = {
+        'cadastre_nr': ('ObjectRelation.ObjectCadastreNr', 'string'),
+        'object_type': ('ObjectRelation.ObjectType', 'string'),
+    }
+    fields = {}
+    records_path = None
+    record_fields = {}
+    ordinal = None
+    # Parse the file incrementally instead of loading the whole object tree into memory
+    stream = False
+    chunk_size = 1024 * 1024
+    # Parse and convert items in this many processes instead, handing over chunks of about chunk_bytes of the file
+    parse_workers = 0
+    chunk_bytes = 4 * 1024 * 1024
+    total = 0
+    size = 0
+    position = 0
+    # Write only records whose content hash has changed, delete records missing from the file
+    delta = False
+    hashes = {}
+    seen = set()
+    # Table has row_hash column, kept up to date by imports without --delta as well
+    hashed = False
+    counts = {}
+    # Records of the item being processed
+    converted = []
+    # Mapped columns which have been empty in every record of the file so far, and number of records
+    empty = set()
+    mapped = 0
+    # Records waiting to be written, keyed by primary key, so that a later record replaces an earlier one
+    pending = {}
+    # Column types of records, as of AddressesImporter.columns, for columnar export (all mapped columns by default)
+    export_columns = None
+    export_partition = 'object_type'
+    writer = None
+
+    @classmethod
+    def mapping(cls):
+        """Returns ItemMapping of the importer class, built once per class"""
+        if '_mapping' not in cls.__dict__:
+            cls._mapping = ItemMapping(cls.relation_fields | cls.fields, cls.records_path, cls.record_fields,
+                                       cls.ordinal)
+
+        return cls._mapping
 
     def process(self):
-        tree = objectify.parse(self.file)
-        root = tree.getroot()
-        root_name = root.tag[root.tag.rfind('}') + 1:]
+        offset = self.start_checkpoint()
+        if offset is None:
+            return
+
+        self.export_columns = self.export_columns or self.mapping().columns
+        with self.dataset_writer(self.export_columns) as self.writer:
+            self.process_items(offset)
+            exclusive(self.timings, ('export', 'write'))
+            if self.writer:
+                with timed(self.timings, 'export'):
+                    self.writer.close()
+                self.count('rows_exported', self.writer.rows)
+
+    def process_items(self, offset=0):
+        self.converted = []
+        self.pending = {}
+        self.counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+        self.hashed = self.delta or self.stores_hashes()
+        self.empty = set(self.mapping().fields | self.mapping().record_fields)
+        self.mapped = 0
+        if self.delta:
+            with timed(self.timings, 'write'):
+                self.load_hashes()
 
-        dataset = root_name.replace('FullData', '')
-        list_name = dataset + 'ItemList'
-        item_name = dataset + 'ItemData'
-
-        total = len(root[list_name][item_name])
         i = 0
         # with self.conn.cursor() as cur:
         #     cur.execute(f'UPDATE {self.table} SET updated = false')
-        for item in root[list_name][item_name]:
-            i += 1
-            self.base = self.getObjectRelation(item)
-            self.processItem(item)
-            if i % 1000 == 0:
-                if self.conn.status == psycopg2.extensions.STATUS_BEGIN:
-                    self.conn.commit()
-                self.logger.debug(f'Processing {i}/{total}')
-
-        self.logger.debug(f'Processed {i} of {total} record(s)')
+        with self.pipeline(self.shared(self.item_records)) as items, self.conn.cursor() as cur:
+            for rows in self.records(items, offset):
+                i += 1
+                for row in rows:
+                    self.pending[self.row_key(row) if self.key else len(self.pending)] = row
+                # Records are written every 1000 items, and committed as well, unless commit_every is given
+                if i % 1000 == 0 or self.commit_every and i % self.commit_every == 0:
+                    if i == min(1000, self.commit_every or 1000) and not offset:
+                        # Records of a mapping which does not fit the file are not to be committed at all
+                        self.check_mapping(complete=False)
+                    with timed(self.timings, 'write'):
+                        self.flush()
+                        if not self.commit_every or i % self.commit_every == 0:
+                            self.commit(cur, i)
+                    self.logger.debug(f'Processing {self.progress(i)}')
+
+        with timed(self.timings, 'write'):
+            self.flush()
+        exclusive(self.timings, ('read', 'parse', 'convert'))
+        self.count('rows_read', i - offset)
+        self.logger.debug(f'Processed {self.progress(i)} record(s)')
+        if i and not offset:
+            self.check_mapping()
+        if self.delta:
+            with timed(self.timings, 'write'):
+                self.delete_missing()
+            self.count('rows_unchanged', self.counts['unchanged'])
+            self.count('rows_deleted', self.counts['deleted'])
+            self.logger.info(f'{self.table}: {self.counts["inserted"]} inserted, {self.counts["updated"]} updated, '
+                             f'{self.counts["unchanged"]} unchanged, {self.counts["deleted"]} deleted')
+        with self.conn.cursor() as cur:
+            self.save_checkpoint(cur, i, completed=True)
         if self.conn.status == psycopg2.extensions.STATUS_BEGIN:
             # with self.conn.cursor() as cur:
             #     cur.execute(f'DELETE FROM {self.table} WHERE updated = false')
             self.conn.commit()
 
-        # print(self.props)
-
     @staticmethod
-    def getattrbypath(item, path, default=None, cast=None):
-        for part in path.split('.'):
-            if not hasattr(item, part):
-                item = default
-                break
-            item = getattr(item, part)
+    def dataset_names(root_tag):
+        root_name = root_tag[root_tag.rfind('}') + 1:]
 
-        item = default if item is None else item
-        item = item.text if item is not None and 'text' in item else item
-        item = cast(item) if cast is not None and item != default else item
+        dataset = root_name.replace('FullData', '')
+        return dataset + 'ItemList', dataset + 'ItemData'
+
+    def item_records(self, skip=0):
+        """Yields mapped records of every item of the file (from item skip on), as a list"""
+        if self.parse_workers:
+            yield from timed_iter(self.parallel_item_records(skip), self.timings, 'convert')
+            return
+
+        items = timed_iter(self.stream_items() if self.stream else self.tree_items(), self.timings, 'parse')
+        mapping = self.mapping()
+        yield from timed_iter((mapping.records(item) for item in itertools.islice(items, skip, None)), self.timings,
+                              'convert')
+
+    def parallel_item_records(self, skip=0):
+        """Yields mapped records of every item (from item skip on), converted by a pool of processes, in file order"""
+        # Workers are forked from a server process, which has not started any threads
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        pending = collections.deque()
+        with ProcessPoolExecutor(self.parse_workers, mp_context=context) as pool:
+            for count, document in self.chunks():
+                if skip >= count:
+                    skip -= count
+                    continue
+                pending.append((skip, pool.submit(convert_chunk, type(self), document)))
+                skip = 0
+                # A couple of chunks per worker are converted ahead, so that memory usage stays bounded
+                if len(pending) >= 2 * self.parse_workers:
+                    first, future = pending.popleft()
+                    yield from future.result()[first:]
+            while pending:
+                first, future = pending.popleft()
+                yield from future.result()[first:]
+
+    def chunks(self):
+        """
+        Yields the file cut at *ItemData boundaries into documents of about chunk_bytes each, as (number of items,
+        document) tuples. Every document consists of the start of the file (up to the first item), whole items, and end
+        tags of elements left open by the start.
+        """
+        item_name = self.dataset_names(sniff_root_tag(self.source))[1].encode()
+        item_start = re.compile(rb'<([\w.-]+:)?' + item_name + rb'[\s/>]')
+        head = end_tag = tail = None
+        buffer = b''
+        with self.open_source() as f:
+            self.size = self.source.size
+            self.position = 0
+            while True:
+                chunk = f.read(self.chunk_size)
+                self.position += len(chunk)
+                buffer += chunk
+                if head is None:
+                    match = item_start.search(buffer)
+                    if not match:
+                        if chunk:
+                            continue
+                        return
+                    head, buffer = buffer[:match.start()], buffer[match.start():]
+                    end_tag = b'</' + (match.group(1) or b'') + item_name + b'>'
+                    tail = closing_tags(head)
+                if len(buffer) >= self.chunk_bytes or not chunk:
+                    end = buffer.rfind(end_tag)
+                    if end >= 0:
+                        end += len(end_tag)
+                        yield buffer.count(end_tag, 0, end), head + buffer[:end] + tail
+                        buffer = buffer[end:]
+                if not chunk:
+                    return
+
+    def records(self, items, skip=0):
+        """Yields records to be written of every item, as a list (empty for the first skip items, already imported)"""
+        for records in items:
+            if skip:
+                skip -= 1
+                if self.delta:
+                    # Records of skipped items are not to be deleted as missing
+                    self.seen.update(self.row_key(row) for row in records)
+                yield []
+                continue
+            self.mapped += len(records)
+            for record in records:
+                if self.empty:
+                    self.empty.difference_update([column for column in self.empty if record.get(column) is not None])
+                # Records of a feed are shared with importers into other databases, which modify them while writing
+                self.saveItem(dict(record) if self.feed else record)
+            records, self.converted = self.converted, []
+            yield records
+
+    def check_mapping(self, complete=True):
+        """
+        Fails if nothing but the object relation has been found in records so far, and warns about mapped columns which
+        have been empty in every record of the file, once it has been processed completely, as their paths are likely
+        to be wrong
+        """
+        mapping = self.mapping()
+        fields = mapping.fields | mapping.record_fields
+        failed = not self.mapped or self.empty >= set(fields) - set(self.relation_fields)
+        if not failed and (not complete or not self.empty):
+            return
+
+        # Without records, every column would be reported
+        for column in [column for column in fields if column in self.empty and self.mapped]:
+            self.logger.warning(f'{self.table}.{column} is empty in every record of {self.source.name}'
+                                f'{"" if complete else " so far"}, no element matches {fields[column][0]}')
+        self.logger.warning(f'Elements with values found in items of {self.source.name}: '
+                            f'{", ".join(sorted(self.item_paths()))}')
+
+        if not self.mapped:
+            raise RuntimeError(f'No {mapping.records_path} elements found in {self.source.name}')
+        if failed:
+            raise RuntimeError(f'No elements mapped to {self.table} columns found in {self.source.name}')
+
+    def item_paths(self, limit=100):
+        """Returns paths (as of ItemMapping) of elements with a value found in the first limit items of the file"""
+        paths = set()
+        for item in itertools.islice(self.stream_items(), limit):
+            for element in item.iterdescendants():
+                if len(element) or not (element.text or '').strip():
+                    continue
+                names = []
+                while element is not item:
+                    names.append(etree.QName(element).localname)
+                    element = element.getparent()
+                paths.add('.'.join(reversed(names)))
+
+        return paths
+
+    def progress(self, i):
+        if self.stream or self.parse_workers:
+            percent = self.position / self.size * 100 if self.size else 100
+            return f'{i} ({self.position}/{self.size} bytes, {percent:.1f}%)'
+        return f'{i} of {self.total}'
+
+    def tree_items(self):
+        with self.open_source() as f:
+            tree = etree.parse(f, etree.XMLParser(remove_blank_text=True, huge_tree=True))
+        root = tree.getroot()
+        namespace = root.tag[:root.tag.rfind('}') + 1]
+        list_name, item_name = self.dataset_names(root.tag)
+
+        items = root.find(namespace + list_name).findall(namespace + item_name)
+        self.total = len(items)
+        yield from items
+
+    def stream_items(self):
+        """Yields *ItemData elements one by one, discarding each of them (and its processed siblings) afterwards"""
+        root_tag = sniff_root_tag(self.source)
+        item_tag = root_tag[:root_tag.rfind('}') + 1] + self.dataset_names(root_tag)[1]
+
+        parser = etree.XMLPullParser(events=('end',), tag=item_tag, remove_blank_text=True, huge_tree=True)
+
+        with self.open_source() as f:
+            self.size = self.source.size
+            self.position = 0
+            while chunk := f.read(self.chunk_size):
+                self.position += len(chunk)
+                parser.feed(chunk)
+                for _, element in parser.read_events():
+                    yield element
+                    element.clear()
+                    while element.getprevious() is not None:
+                        element.getparent().remove(element.getprevious())
+            parser.close()
+
+    def row_key(self, row):
+        return tuple(row[column] for column in self.key)
+
+    def load_hashes(self):
+        self.seen = set()
+        with self.conn.cursor() as cur:
+            cur.execute(f'SELECT {", ".join(self.key)}, row_hash FROM {self.table}')
+            self.hashes = {tuple(row[:-1]): row[-1] for row in cur.fetchall()}
+
+    def delete_missing(self):
+        missing = sorted(self.hashes.keys() - self.seen)
+        condition = ' AND '.join(f't.{column} = m.{column}' for column in self.key)
+        with self.conn.cursor() as cur:
+            psycopg2.extras.execute_values(
+                cur, f'DELETE FROM {self.table} t USING (VALUES %s) m ({", ".join(self.key)}) WHERE {condition}',
+                missing, page_size=10000)
+            if self.changes:
+                self.save_changes(cur, [('delete', dict(zip(self.key, key)), None) for key in missing])
+        self.counts['deleted'] = len(missing)
+
+    def record_changes(self, rows):
+        """Records rows which are new or changed (with new values of changed columns) compared to stored ones"""
+        with self.conn.cursor() as cur:
+            # Both new and stored values are converted to column types and back to JSON, so that e.g. dates compare
+            # (and are recorded) the same, however the importer formats them
+            stored = psycopg2.extras.execute_values(
+                cur,
+                f'SELECT to_jsonb(n), to_jsonb(t) FROM (VALUES %s) v (i, row) '
+                f'CROSS JOIN LATERAL jsonb_populate_record(NULL::{self.table}, v.row::jsonb) n '
+                f'LEFT JOIN {self.table} t ON {" AND ".join(f"t.{column} = n.{column}" for column in self.key)} '
+                f'ORDER BY v.i',
+                [(i, psycopg2.extras.Json(row)) for i, row in enumerate(rows)], page_size=len(rows), fetch=True)
+
+            changes = []
+            for row, (new, old) in zip(rows, stored):
+                key = {column: new[column] for column in self.key}
+                if old is None:
+                    changes.append(('insert', key, {column: new[column] for column in row}))
+                    continue
+                changed = {column: new[column] for column in row if new[column] != old[column]}
+                if changed:
+                    changes.append(('update', key, changed))
+            if changes:
+                self.save_changes(cur, changes)
 
-        return item
+    @staticmethod
+    def row_hash(row):
+        return hashlib.md5(repr(sorted(row.items())).encode()).hexdigest()
 
-    def getObjectRelation(self, item):
-        return {
-            'cadastre_nr': self.getattrbypath(item, 'ObjectRelation.ObjectCadastreNr', None, str),
-            'object_type': self.getattrbypath(item, 'ObjectRelation.ObjectType', None, str),
-        } if self.getattrbypath(item, 'ObjectRelation.ObjectCadastreNr', None, str) is not None else {}
+    def saveItem(self, row):
+        self.converted.append(row)
 
-    def processItem(self, item):
+    def resolve(self, rows):
+        """Prepares buffered rows for writing, e.g. resolves lookup values to ids"""
         pass
 
-    def saveItem(self, row):
-        cur = self.conn.cursor()
-        try:
+    def changed_rows(self, rows):
+        changed = []
+        for row in rows:
+            key = self.row_key(row)
+            row['row_hash'] = self.row_hash(row)
+            self.seen.add(key)
+            if self.hashes.get(key) == row['row_hash']:
+                self.counts['unchanged'] += 1
+                continue
+            self.counts['updated' if key in self.hashes else 'inserted'] += 1
+            self.hashes[key] = row['row_hash']
+            changed.append(row)
+
+        return changed
+
+    def flush(self):
+        """Writes buffered records with one multi-row statement per set of columns"""
+        rows = list(self.pending.values())
+        self.pending = {}
+        if not rows:
+            return
+
+        self.resolve(rows)
+        if self.changes and self.key:
+            self.record_changes(rows)
+        if self.writer:
+            with timed(self.timings, 'export'):
+                for row in rows:
+                    self.writer.add(tuple(row.get(column) for column in self.export_columns))
+        if self.delta:
+            rows = self.changed_rows(rows)
+        elif self.hashed:
+            for row in rows:
+                row['row_hash'] = self.row_hash(row)
+
+        batches = {}
+        for row in rows:
             row['updated'] = True
-            columns = list(row.keys())
-            placeholders = [f'%({key})s' for key in row.keys()]
-            sets = ', '.join(f'{column} = {placeholder}' for column, placeholder in
-                             zip(columns, placeholders))
+            batches.setdefault(tuple(row.keys()), []).append(tuple(row.values()))
 
-            sql = f'INSERT INTO {self.table} ({",".join(columns)}) VALUES ({",".join(placeholders)})'
-            if self.pkey:
-                sql += f' ON CONFLICT ON CONSTRAINT {self.table + "_pkey"} DO UPDATE SET {sets}'
-
-            cur.execute(sql, row)
-        except psycopg2.Error as e:
-            print(cur.query)
-            print(e)
-            raise e
+        with self.conn.cursor() as cur:
+            for columns, values in batches.items():
+                sql = f'INSERT INTO {self.table} ({",".join(columns)}) VALUES %s'
+                if self.key:
+                    sets = ', '.join(f'{column} = EXCLUDED.{column}' for column in columns)
+                    sql += f' ON CONFLICT ON CONSTRAINT {self.table + "_pkey"} DO UPDATE SET {sets}'
+                try:
+                    psycopg2.extras.execute_values(cur, sql, values, page_size=len(values))
+                    self.count('rows_written', len(values))
+                except psycopg2.Error as e:
+                    self.logger.error(f'Error writing {len(values)} record(s) to {self.table}')
+                    self.logger.error(e)
+                    raise e
 
 
 class MarksImporter(ParcelMetadataImporter):
     table = 'marks'
+    records_path = 'MarkList'
+    record_fields = {
+        'mark_type': ('MarkRecData.MarkType', 'int'),
+        'date': ('MarkRecData.MarkDate', 'date'),
+        'description': ('MarkRecData.MarkDescription', 'string'),
+    }
+    # Descriptions are written to mark_types only
+    export_columns = {'cadastre_nr': 'string', 'object_type': 'string', 'mark_type': 'int', 'date': 'date'}
+    mark_types = set()
+    new_mark_types = {}
 
-    def processItem(self, item):
-        for mark in item.MarkList:
-            mark_type = self.getattrbypath(mark, 'MarkRecData.MarkType', None, int)
-            date = self.getattrbypath(mark, 'MarkRecData.MarkDate', None, str)
-            description = self.getattrbypath(mark, 'MarkRecData.MarkDescription', None, str)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.new_mark_types = {}
+        with self.conn.cursor() as cur:
+            cur.execute('SELECT id FROM mark_types')
+            self.mark_types = {row[0] for row in cur.fetchall()}
 
-            record = self.base | {
-                'mark_type': mark_type,
-                'date': date,
-            }
+    def saveItem(self, row):
+        description = row.pop('description')
+        if row['mark_type'] is not None and row['mark_type'] not in self.mark_types:
+            self.new_mark_types[row['mark_type']] = description
 
-            cur = self.conn.cursor()
-            try:
-                cur.execute("""
-                    INSERT INTO mark_types 
-                    (id, description) 
-                    VALUES (%s, %s)
-                    ON CONFLICT ON CONSTRAINT mark_types_pkey DO NOTHING
-                    """,
-                            (mark_type, description))
-            except psycopg2.Error as e:
-                pass
+        super().saveItem(row)
 
-            self.saveItem(record)
+    def resolve(self, rows):
+        # Descriptions of new mark types are collected by saveItem()
+        missing = {row['mark_type'] for row in rows if row['mark_type'] is not None} - self.mark_types
+        if missing:
+            with self.conn.cursor() as cur:
+                psycopg2.extras.execute_values(
+                    cur,
+                    'INSERT INTO mark_types (id, description) VALUES %s '
+                    'ON CONFLICT ON CONSTRAINT mark_types_pkey DO NOTHING',
+                    [(mark_type, self.new_mark_types.get(mark_type)) for mark_type in missing])
+            self.mark_types.update(missing)
 
 
 class ValuationsImporter(ParcelMetadataImporter):
     table = 'valuations'
-
-    def processItem(self, item):
-        self.props = self.props | item.__dict__.keys()
-
-        record = self.base | {
-            'property_valuation': self.getattrbypath(item, 'PropertyValuation', None, int),
-            'property_valuation_date': self.getattrbypath(item, 'PropertyValuationDate', None, str),
-            'property_cadastral_value': self.getattrbypath(item, 'PropertyCadastralValue', None, int),
-            'property_cadastral_value_date': self.getattrbypath(item, 'PropertyCadastralValueDate', None, str),
-            'object_cadastral_value': self.getattrbypath(item, 'ObjectCadastralValue', None, int),
-            'object_cadastral_value_date': self.getattrbypath(item, 'ObjectCadastralValueDate', None, str),
-            'object_forest_value': self.getattrbypath(item, 'ObjectForestValue', None, int),
-            'object_forest_value_date': self.getattrbypath(item, 'ObjectForestValueDate', None, str),
-        }
-
-        self.saveItem(record)
+    fields = {
+        'property_valuation': ('PropertyValuation', 'int'),
+        'property_valuation_date': ('PropertyValuationDate', 'date'),
+        'property_cadastral_value': ('PropertyCadastralValue', 'int'),
+        'property_cadastral_value_date': ('PropertyCadastralValueDate', 'date'),
+        'object_cadastral_value': ('ObjectCadastralValue', 'int'),
+        'object_cadastral_value_date': ('ObjectCadastralValueDate', 'date'),
+        'object_forest_value': ('ObjectForestValue', 'int'),
+        'object_forest_value_date': ('ObjectForestValueDate', 'date'),
+    }
 
 
-class AddressesImporter(ParcelMetadataImporter):
+class ParcelAddressesImporter(ParcelMetadataImporter):
     table = 'addresses'
-
-    def processItem(self, item):
-        self.props = self.props | item.__dict__.keys()
-
-        record = self.base | {
-            'ar_code': self.getattrbypath(item, 'AddressData.ARCode', None, int),
-            'post_index': self.getattrbypath(item, 'AddressData.PostIndex', None, str),
-            'county': self.getattrbypath(item, 'AddressData.County', None, str),
-            'parish': self.getattrbypath(item, 'AddressData.Parish', None, str),
-            'town': self.getattrbypath(item, 'AddressData.Town', None, str),
-            'village': self.getattrbypath(item, 'AddressData.Village', None, str),
-            'house': self.getattrbypath(item, 'AddressData.House', None, str),
-        }
-
-        self.saveItem(record)
+    fields = {
+        'ar_code': ('AddressData.ARCode', 'int'),
+        'post_index': ('AddressData.PostIndex', 'string'),
+        'county': ('AddressData.County', 'string'),
+        'parish': ('AddressData.Parish', 'string'),
+        'town': ('AddressData.Town', 'string'),
+        'village': ('AddressData.Village', 'string'),
+        'house': ('AddressData.House', 'string'),
+    }
+    export_dictionary = ('post_index', 'county', 'parish', 'town', 'village')
 
 
 class OwnershipsImporter(ParcelMetadataImporter):
     table = 'ownerships'
+    records_path = 'OwnershipStatusKindList.OwnershipStatusKind'
+    # Descriptions are resolved to ids by resolve() before records are written
+    record_fields = {
+        'ownership_status_id': ('OwnershipStatusKind.OwnershipStatus', 'string'),
+        'person_status_id': ('OwnershipStatusKind.PersonStatus', 'string'),
+    }
+    export_columns = {'cadastre_nr': 'string', 'object_type': 'string', 'ownership_status_id': 'int',
+                      'person_status_id': 'int'}
     ownership_statuses = {}
     ownership_person_statuses = {}
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        with self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute('SELECT id, description FROM ownership_statuses')
-            self.ownership_statuses = cur.fetchall()
-            cur.execute('SELECT id, description FROM ownership_person_statuses')
-            self.ownership_person_statuses = cur.fetchall()
-
-    def processItem(self, item):
-        self.props = self.props | item.__dict__.keys()
-
-        for kind in self.getattrbypath(item, 'OwnershipStatusKindList.OwnershipStatusKind', []):
-            status = self.getattrbypath(kind, 'OwnershipStatusKind.OwnershipStatus', None, str)
-            person_status = self.getattrbypath(kind, 'OwnershipStatusKind.PersonStatus', None, str)
-
-            ownership_status_id = next(
-                (x for x in self.ownership_statuses if x['description'] == status),
-                {}
-            ).get('id', None)
-            person_status_id = next(
-                (x for x in self.ownership_person_statuses if x['description'] == person_status),
-                {}
-            ).get('id', None)
-
-            if not ownership_status_id:
-                with self.conn.cursor() as cur:
-                    cur.execute(
-                        'INSERT INTO ownership_statuses (description) VALUES (%s) RETURNING id',
-                        (status,)
-                    )
-                    ownership_status_id = cur.fetchone()[0]
-                    self.ownership_statuses.append({'id': ownership_status_id, 'description': status})
-
-            if not person_status_id:
+        with self.conn.cursor() as cur:
+            cur.execute('SELECT description, id FROM ownership_statuses')
+            self.ownership_statuses = dict(cur.fetchall())
+            cur.execute('SELECT description, id FROM ownership_person_statuses')
+            self.ownership_person_statuses = dict(cur.fetchall())
+
+    def resolve(self, rows):
+        for column, table, ids in (('ownership_status_id', 'ownership_statuses', self.ownership_statuses),
+                                   ('person_status_id', 'ownership_person_statuses', self.ownership_person_statuses)):
+            missing = {row[column] for row in rows} - ids.keys()
+            if missing:
                 with self.conn.cursor() as cur:
-                    cur.execute(
-                        'INSERT INTO ownership_person_statuses (description) VALUES (%s) RETURNING id',
-                        (person_status,)
-                    )
-                    person_status_id = cur.fetchone()[0]
-                    self.ownership_person_statuses.append({'id': person_status_id, 'description': person_status})
+                    inserted = psycopg2.extras.execute_values(
+                        cur,
+                        f'INSERT INTO {table} (description) VALUES %s RETURNING description, id',
+                        [(description,) for description in missing],
+                        fetch=True)
+                ids.update(dict(inserted))
+
+            for row in rows:
+                row[column] = ids[row[column]]
+
+
+class PropertiesImporter(ParcelMetadataImporter):
+    table = 'properties'
+    key = ('cadastre_nr', 'part_cadastre_nr')
+    fields = {
+        'name': ('PropertyName', 'string'),
+    }
+    # A record per cadastre object the property consists of
+    records_path = 'PropertyObjectList.PropertyObject'
+    record_fields = {
+        'part_cadastre_nr': ('ObjectCadastreNr', 'string'),
+        'part_type': ('ObjectType', 'string'),
+    }
+
+
+class ParcelsImporter(ParcelMetadataImporter):
+    table = 'parcels'
+    fields = {
+        'area': ('ParcelBasicData.ParcelArea', 'int'),
+        'liz_value': ('ParcelBasicData.ParcelLizValue', 'int'),
+    }
+
+
+class ParcelPartsImporter(ParcelMetadataImporter):
+    table = 'parcel_parts'
+    fields = {
+        'area': ('ParcelPartBasicData.ParcelPartArea', 'int'),
+        'liz_value': ('ParcelPartBasicData.ParcelPartLizValue', 'int'),
+    }
+
+
+class EncumbrancesImporter(ParcelMetadataImporter):
+    table = 'encumbrances'
+    key = ('cadastre_nr', 'nr')
+    records_path = 'EncumbranceList.EncumbranceRecData'
+    record_fields = {
+        'kind_id': ('EncumbranceKindId', 'int'),
+        'kind_name': ('EncumbranceKindName', 'string'),
+        'area': ('EncumbranceArea', 'float'),
+        'establish_date': ('EncumbranceEstablishDate', 'date'),
+    }
+    ordinal = 'nr'
+    export_dictionary = ('kind_name',)
+
+
+class BuildingsImporter(ParcelMetadataImporter):
+    table = 'buildings'
+    fields = {
+        'name': ('BuildingBasicData.BuildingName', 'string'),
+        'use_kind_id': ('BuildingBasicData.BuildingUseKindId', 'int'),
+        'use_kind_name': ('BuildingBasicData.BuildingUseKindName', 'string'),
+        'area': ('BuildingBasicData.BuildingArea', 'float'),
+        'construction_area': ('BuildingBasicData.BuildingConstrArea', 'float'),
+        'ground_floors': ('BuildingBasicData.BuildingGroundFloors', 'int'),
+        'underground_floors': ('BuildingBasicData.BuildingUndergroundFloors', 'int'),
+        'exploitation_year': ('BuildingBasicData.BuildingExploitYear', 'int'),
+        'fire_resistance': ('BuildingBasicData.BuildingFireresistance', 'string'),
+        'premise_group_count': ('BuildingBasicData.BuildingPregCount', 'int'),
+        'deprecation': ('BuildingBasicData.BuildingDeprecation', 'int'),
+        'deprecation_date': ('BuildingBasicData.BuildingDepValDate', 'date'),
+    }
+    export_dictionary = ('use_kind_name', 'fire_resistance')
+
+
+class PremiseGroupsImporter(ParcelMetadataImporter):
+    table = 'premise_groups'
+    fields = {
+        'name': ('PremiseGroupBasicData.PremiseGroupName', 'string'),
+        'building_floor': ('PremiseGroupBasicData.PremiseGroupBuildingFloor', 'int'),
+        'use_kind_id': ('PremiseGroupBasicData.PremiseGroupUseKindId', 'int'),
+        'use_kind_name': ('PremiseGroupBasicData.PremiseGroupUseKindName', 'string'),
+        'premise_count': ('PremiseGroupBasicData.PremiseGroupPremiseCount', 'int'),
+        'area': ('PremiseGroupBasicData.PremiseGroupArea', 'float'),
+    }
+    export_dictionary = ('use_kind_name',)
 
-            record = self.base | {
-                'ownership_status_id': ownership_status_id,
-                'person_status_id': person_status_id,
-            }
 
-            self.saveItem(record)
+# Root element tags of XML files, keyed by path, size and modification time (and archive member name)
+root_tags = {}
 
 
-def get_file_importer(file_name):
+def closing_tags(document):
+    """Returns end tags of elements left open at the end of a (partial) XML document"""
+    open_tags = []
+    for closing, name, empty in re.findall(rb'<(/?)([^\s/>?!]+)[^>]*?(/?)>', document):
+        if closing:
+            open_tags.pop()
+        elif not empty:
+            open_tags.append(name)
+
+    return b''.join(b'</' + name + b'>' for name in reversed(open_tags))
+
+
+def convert_chunk(importer_class, document):
+    """Returns mapped records of every item of a chunk of a file (see ParcelMetadataImporter.chunks), as lists"""
+    root = etree.fromstring(document, etree.XMLParser(remove_blank_text=True, huge_tree=True))
+    item_tag = root.tag[:root.tag.rfind('}') + 1] + importer_class.dataset_names(root.tag)[1]
+    mapping = importer_class.mapping()
+
+    return [mapping.records(item) for item in root.iter(item_tag)]
+
+
+def sniff_root_tag(file):
+    """Returns root element tag (including namespace) of XML file, reading no further than its start"""
+    source = as_source(file)
+    if source.key not in root_tags:
+        root_tags[source.key] = None
+        with source.open() as f:
+            for _, element in etree.iterparse(f, events=('start',)):
+                root_tags[source.key] = element.tag
+                break
+
+    return root_tags[source.key]
+
+
+def load_root_tags(cache_file):
+    if os.path.exists(cache_file):
+        with open(cache_file, 'r') as f:
+            root_tags.update(json.load(f))
+
+
+def save_root_tags(cache_file):
+    # Entries for files which have been changed or removed since are not worth keeping
+    for key in list(root_tags.keys()):
+        path = key.split('|')[0].rsplit(':', 2)[0]
+        if not os.path.exists(path) or not key.startswith(file_key(path)):
+            del root_tags[key]
+
+    with open(cache_file, 'w+') as f:
+        json.dump(root_tags, f)
+
+
+def export_changes(conn, path, run_id, logger):
+    """Writes changes recorded by the run into <path>/<run_id>.ndjson, a JSON object per line in order of recording"""
+    os.makedirs(path, exist_ok=True)
+    file_name = os.path.join(path, f'{run_id}.ndjson')
+    rows = 0
+    with conn, conn.cursor('vzd_changes') as cur, open(f'{file_name}.part', 'w', encoding='utf-8') as f:
+        cur.itersize = 10000
+        cur.execute('SELECT id, table_name, operation, key, changes FROM vzd_changes WHERE run_id = %s ORDER BY id',
+                    (run_id,))
+        for id, table, operation, key, changes in cur:
+            f.write(json.dumps({'id': id, 'table': table, 'operation': operation, 'key': key, 'changes': changes},
+                               ensure_ascii=False, default=str) + '\n')
+            rows += 1
+    os.replace(f'{file_name}.part', file_name)
+    logger.info(f'{rows} change(s) written to {file_name}')
+
+
+def get_file_importer(file):
+    source = as_source(file)
+    file_name = source.name
     importers_map = {}
     checkstr = None
     if file_name.lower().endswith('.csv'):
@@ -463,19 +1740,18 @@ def get_file_importer(file_name):
         importers_map = {
             'MarkFullData': MarksImporter,  # Atzīmi raksturojošie dati
             'ValuationFullData': ValuationsImporter,  # Kadastra objektu novērtējumi un kadastrālās vērtības
-            'AddressFullData': AddressesImporter,  # Kadastra objektam reģistrētās adreses
+            'AddressFullData': ParcelAddressesImporter,  # Kadastra objektam reģistrētās adreses
             'OwnershipFullData': OwnershipsImporter,  # Nekustamo īpašumu un būvju īpašumtiesību statusi
-            # 'PropertyFullData': PropertiesImporter,  # Nekustamais īpašums un tā sastāvs
-            # 'ParcelPartFullData': ParcelPartsImporter,  # Zemes vienību daļas raksturojošie dati
-            # 'EncumbranceFullData': EncumbrancesImporter,  # Kadastra objektam reģistrētie apgrūtinājumi
-            # 'ParcelFullData': ParcelsImporter,  # Zemes vienības raksturojošie dati
-            # 'PremiseGroupFullData': PremiseGroupsImporter,  # Telpu grupu raksturojošie dati
-            # 'BuildingFullData': BuildingsImporter,  # Būves raksturojošie dati
+            'PropertyFullData': PropertiesImporter,  # Nekustamais īpašums un tā sastāvs
+            'ParcelPartFullData': ParcelPartsImporter,  # Zemes vienību daļas raksturojošie dati
+            'EncumbranceFullData': EncumbrancesImporter,  # Kadastra objektam reģistrētie apgrūtinājumi
+            'ParcelFullData': ParcelsImporter,  # Zemes vienības raksturojošie dati
+            'PremiseGroupFullData': PremiseGroupsImporter,  # Telpu grupu raksturojošie dati
+            'BuildingFullData': BuildingsImporter,  # Būves raksturojošie dati
         }
 
-        tree = objectify.parse(file_name)
-        root = tree.getroot()
-        checkstr = root.tag[root.tag.rfind('}') + 1:]
+        root_tag = sniff_root_tag(source)
+        checkstr = root_tag[root_tag.rfind('}') + 1:] if root_tag else None
 
     if checkstr in importers_map:
         return importers_map[checkstr]
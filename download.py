@@ -0,0 +1,207 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os.path
+import zipfile
+
+import httpx
+
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadError(Exception):
+    pass
+
+
+def file_hash(file_name, algorithm='sha256'):
+    digest = hashlib.new(algorithm)
+    with open(file_name, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+
+    return digest
+
+
+def expected_digests(headers):
+    """Returns algorithm => digest pairs announced by server via Digest, Repr-Digest or Content-MD5 headers"""
+    digests = {}
+    for header in ('digest', 'repr-digest'):
+        for item in headers.get(header, '').split(','):
+            algorithm, _, value = item.strip().partition('=')
+            algorithm = algorithm.lower().replace('-', '')
+            if algorithm in ('sha256', 'sha512', 'md5') and value:
+                digests[algorithm] = base64.b64decode(value.strip(':'))
+    if 'content-md5' in headers:
+        digests['md5'] = base64.b64decode(headers['content-md5'])
+
+    return digests
+
+
+def stored_etag(target_file_name):
+    """Returns ETag of the downloaded target file, None if there is none (or an interrupted download to be resumed)"""
+    etag_file_name = f'{target_file_name}.etag'
+    if not os.path.exists(target_file_name) or not os.path.exists(etag_file_name) \
+            or os.path.exists(f'{target_file_name}.part'):
+        return None
+
+    with open(etag_file_name) as f:
+        return f.read(1024) or None
+
+
+async def modified(client, uri, target_file_name, logger):
+    """Returns True unless server responds to a conditional request for uri with 304 Not Modified"""
+    etag = stored_etag(target_file_name)
+    if etag is None:
+        return True
+
+    try:
+        # Body of a modified file is not read, it is downloaded later
+        async with client.stream('GET', uri, headers={'If-None-Match': etag}) as response:
+            logger.debug(f'{uri}: {response.status_code}')
+            return response.status_code != 304
+    except httpx.HTTPError as e:
+        # Download will be attempted (and its failure reported) as usual
+        logger.debug(f'Failed to check {uri}: {e}')
+        return True
+
+
+def check_updates(targets, logger, connections=16):
+    """
+    Checks whether files have been changed since they were downloaded, with conditional requests (stored ETags) issued
+    concurrently over one pooled connection, and without downloading anything.
+
+    targets is uri => target file name, returns set of uris to be downloaded.
+    """
+    async def check():
+        limits = httpx.Limits(max_connections=connections)
+        async with httpx.AsyncClient(limits=limits, follow_redirects=True) as client:
+            results = await asyncio.gather(*[modified(client, uri, target_file_name, logger)
+                                             for uri, target_file_name in targets.items()])
+        return {uri for uri, result in zip(targets, results) if result}
+
+    return asyncio.run(check())
+
+
+def catalog_uris(file_name):
+    """Returns access URLs of distributions listed in a DCAT JSON-LD catalog file (as published by data.gov.lv)"""
+    with open(file_name, 'rb') as f:
+        catalog = json.load(f)
+
+    return [node['dcat:accessURL']['@id'] for node in catalog['@graph']
+            if isinstance(node.get('dcat:accessURL'), dict) and node['dcat:accessURL'].get('@id')]
+
+
+def download(uri, target_file_name, logger, client=None, chunk_size=CHUNK_SIZE, counters=None):
+    """
+    Downloads uri to target_file_name, if it has been changed since the previous download.
+
+    Response is streamed into `<target>.part` and an interrupted transfer is resumed with a Range request on the next
+    call. Only a complete file with verified size (and hash, if announced by server, or archive CRCs for zip files) is
+    renamed into place, and only then its ETag is stored in `<target>.etag`.
+
+    Number of bytes received is added to counters['bytes_downloaded'], if counters are given.
+
+    Returns True if target file has been updated.
+    """
+    etag_file_name = f'{target_file_name}.etag'
+    part_file_name = f'{target_file_name}.part'
+    part_etag_file_name = f'{part_file_name}.etag'
+
+    headers = {}
+
+    if os.path.exists(target_file_name) and os.path.exists(etag_file_name):
+        with open(etag_file_name, 'r+') as f:
+            headers['If-None-Match'] = f.read(1024)
+            logger.debug('Etag: %s' % headers['If-None-Match'])
+
+    offset = 0
+    if os.path.exists(part_file_name) and os.path.exists(part_etag_file_name):
+        with open(part_etag_file_name, 'r+') as f:
+            part_etag = f.read(1024)
+        offset = os.path.getsize(part_file_name)
+        if offset and part_etag:
+            logger.debug(f'Resuming download from byte {offset}')
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = part_etag
+
+    own_client = client is None
+    client = httpx.Client(follow_redirects=True) if own_client else client
+    try:
+        with client.stream('GET', uri, headers=headers) as response:
+            if response.status_code == 304:
+                logger.debug('File not modified')
+                return False
+
+            if response.status_code == 206:
+                start, _, total = response.headers.get('content-range', '').removeprefix('bytes ').partition('/')
+                if not start.startswith(f'{offset}-'):
+                    raise DownloadError(f'Unexpected Content-Range {response.headers.get("content-range")}')
+                expected_size = int(total) if total.isdigit() else None
+                digest = file_hash(part_file_name)
+                mode = 'ab'
+            elif response.status_code == 200:
+                expected_size = int(response.headers['content-length']) if 'content-length' in response.headers \
+                    and 'content-encoding' not in response.headers else None
+                offset = 0
+                digest = hashlib.sha256()
+                mode = 'wb'
+                # Remember what is being downloaded, so that an interrupted transfer can be resumed
+                with open(part_etag_file_name, 'w+') as f:
+                    f.write(response.headers.get('etag', ''))
+            elif response.status_code == 416:
+                # Partial file is not a prefix of the remote file anymore, start over on the next run
+                os.unlink(part_file_name)
+                raise DownloadError(f'Could not resume download of {uri}')
+            else:
+                raise DownloadError(f'Unexpected response status {response.status_code} for {uri}')
+
+            received = offset
+            with open(part_file_name, mode) as f:
+                for chunk in response.iter_bytes(chunk_size):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    received += len(chunk)
+
+            logger.debug(f'Received {received - offset} byte(s), {received} in total')
+            if counters is not None:
+                counters['bytes_downloaded'] = counters.get('bytes_downloaded', 0) + received - offset
+            announced = expected_digests(response.headers) if response.status_code == 200 else {}
+            etag = response.headers.get('etag')
+    finally:
+        if own_client:
+            client.close()
+
+    if expected_size is not None and received != expected_size:
+        raise DownloadError(f'Size mismatch for {uri}: expected {expected_size}, received {received}')
+
+    for algorithm, value in announced.items():
+        actual = digest.digest() if algorithm == 'sha256' else file_hash(part_file_name, algorithm).digest()
+        if actual != value:
+            os.unlink(part_file_name)
+            raise DownloadError(f'{algorithm} mismatch for {uri}')
+
+    if target_file_name.lower().endswith('.zip'):
+        try:
+            with zipfile.ZipFile(part_file_name) as zip:
+                corrupt = zip.testzip()
+        except zipfile.BadZipFile as e:
+            corrupt = str(e)
+        if corrupt is not None:
+            os.unlink(part_file_name)
+            raise DownloadError(f'Corrupt archive downloaded from {uri}: {corrupt}')
+
+    logger.debug(f'Verified {target_file_name}, sha256 {digest.hexdigest()}')
+    os.replace(part_file_name, target_file_name)
+
+    if etag:
+        logger.debug('New etag: %s' % etag)
+        with open(etag_file_name, 'w+') as f:
+            f.write(etag)
+    elif os.path.exists(etag_file_name):
+        os.unlink(etag_file_name)
+
+    if os.path.exists(part_etag_file_name):
+        os.unlink(part_etag_file_name)
+
+    return True
@@ -0,0 +1,350 @@
+import io
+import os.path
+import struct
+import time
+
+import shapefile
+
+from defs import ArchiveMember, CopyStream, file_key
+from download import file_hash
+from metrics import TimedReader, exclusive, timed, timed_iter
+
+LAYERS = [
+    'KKCadastralGroup',
+    'KKBuilding',
+    'KKEngineeringStructurePoly',
+    'KKParcel',
+    'KKParcelBorderPoint',
+    'KKParcelError',
+    'KKParcelPart',
+    'KKSurveyingStatus',
+    'KKWayRestriction',
+]
+
+# Shapefile shape type => geometry type of the table (polygons and lines are always stored as multi geometries)
+geometry_types = {
+    shapefile.POINT: 'Point',
+    shapefile.POINTZ: 'Point',
+    shapefile.POINTM: 'Point',
+    shapefile.MULTIPOINT: 'MultiPoint',
+    shapefile.MULTIPOINTZ: 'MultiPoint',
+    shapefile.MULTIPOINTM: 'MultiPoint',
+    shapefile.POLYLINE: 'MultiLineString',
+    shapefile.POLYLINEZ: 'MultiLineString',
+    shapefile.POLYLINEM: 'MultiLineString',
+    shapefile.POLYGON: 'MultiPolygon',
+    shapefile.POLYGONZ: 'MultiPolygon',
+    shapefile.POLYGONM: 'MultiPolygon',
+}
+
+wkb_types = {
+    'Point': 1,
+    'LineString': 2,
+    'Polygon': 3,
+    'MultiPoint': 4,
+    'MultiLineString': 5,
+    'MultiPolygon': 6,
+}
+
+
+def layer_sources(archives):
+    """Returns layer => list of its shapefiles, each as extension => ArchiveMember, found in archives"""
+    sources = {}
+    for archive in archives:
+        members = {info.filename.lower(): info for info in archive.infolist() if not info.is_dir()}
+        for layer in LAYERS:
+            for name, info in members.items():
+                if os.path.basename(name) != f'{layer.lower()}.shp':
+                    continue
+                files = {'.shp': ArchiveMember(archive, info)}
+                for extension in ('.dbf', '.shx', '.cpg'):
+                    if name[:-4] + extension in members:
+                        files[extension] = ArchiveMember(archive, members[name[:-4] + extension])
+                sources.setdefault(layer, []).append(files)
+
+    return sources
+
+
+def archive_entry(file_name, previous=None):
+    """
+    Returns manifest entry (ETag, sha256 and file key) of a downloaded archive.
+
+    Archive is hashed only if its file key (path, size and mtime) differs from the one of the previous entry.
+    """
+    key = file_key(file_name)
+    if previous and previous['file_key'] == key:
+        return previous
+
+    etag = None
+    if os.path.exists(f'{file_name}.etag'):
+        with open(f'{file_name}.etag') as f:
+            etag = f.read(256) or None
+
+    return {'etag': etag, 'sha256': file_hash(file_name).hexdigest(), 'file_key': key}
+
+
+def load_manifest(cur):
+    """Returns (archive, layer) => manifest entry of imported archives"""
+    cur.execute('SELECT archive, layer, etag, sha256, file_key FROM kadastrs_archives')
+
+    return {(archive, layer): {'etag': etag, 'sha256': sha256, 'file_key': key}
+            for archive, layer, etag, sha256, key in cur.fetchall()}
+
+
+def save_manifest(cur, archive, layer, entry):
+    cur.execute('INSERT INTO kadastrs_archives (archive, layer, etag, sha256, file_key) '
+                'VALUES (%(archive)s, %(layer)s, %(etag)s, %(sha256)s, %(file_key)s) '
+                'ON CONFLICT (archive, layer) DO UPDATE SET etag = EXCLUDED.etag, sha256 = EXCLUDED.sha256, '
+                'file_key = EXCLUDED.file_key, imported_at = now()',
+                entry | {'archive': archive, 'layer': layer})
+
+
+def delete_manifest(cur, archive, layer):
+    cur.execute('DELETE FROM kadastrs_archives WHERE archive = %s AND layer = %s', (archive, layer))
+
+
+def imported_layers(cur):
+    """Returns layers, whose tables exist and have features tagged with their source archive"""
+    cur.execute("SELECT table_name FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND column_name = 'source'")
+    tables = {row[0] for row in cur.fetchall()}
+
+    return {layer for layer in LAYERS if layer.lower() in tables}
+
+
+def column_type(kind, size, decimal):
+    """Returns SQL type of a dbf field, same as shp2pgsql would"""
+    if kind == 'C':
+        return f'varchar({size})'
+    elif kind == 'D':
+        return 'date'
+    elif kind == 'L':
+        return 'boolean'
+    elif kind == 'N' and not decimal:
+        return 'int2' if size < 5 else 'int4' if size < 10 else 'int8' if size < 19 else 'numeric'
+    elif kind in ('N', 'F'):
+        return 'float8' if size < 19 else 'numeric'
+
+    return 'text'
+
+
+def wkb(kind, coordinates):
+    if kind == 'Point':
+        return struct.pack('<2d', *coordinates[:2])
+    elif kind == 'LineString':
+        return struct.pack(f'<I{len(coordinates) * 2}d', len(coordinates),
+                           *(value for point in coordinates for value in point[:2]))
+    elif kind == 'Polygon':
+        return struct.pack('<I', len(coordinates)) + b''.join(wkb('LineString', ring) for ring in coordinates)
+
+    part = kind[len('Multi'):]
+    return struct.pack('<I', len(coordinates)) + b''.join(
+        struct.pack('<BI', 1, wkb_types[part]) + wkb(part, geometry) for geometry in coordinates)
+
+
+def ewkb(geometry, srid):
+    """Returns hex encoded EWKB of a GeoJSON-like geometry, polygons and lines are turned into multi geometries"""
+    kind, coordinates = geometry['type'], geometry['coordinates']
+    if kind in ('Polygon', 'LineString'):
+        kind, coordinates = f'Multi{kind}', [coordinates]
+
+    return (struct.pack('<BII', 1, wkb_types[kind] | 0x20000000, srid) + wkb(kind, coordinates)).hex()
+
+
+class LayerImporter:
+    """
+    Imports a cadastre layer (KKParcel, etc) from shapefiles of territory archives into a single table.
+
+    process() drops and recreates the table: features are read straight from archives and streamed with COPY into it,
+    geometries are transformed from LKS-92 and indexed once all of them have been loaded. replace() replaces features of
+    a single archive in the existing table instead. Every feature is tagged with its archive in the `source` column, and
+    the manifest entries of imported archives are saved within the same transaction.
+    """
+    conn = None
+    logger = None
+    layer = None
+    table = None
+    sources = []
+    entries = {}
+    srid = 3059
+    target_srid = 4326
+    timings = {}
+    counters = {}
+
+    def __init__(self, conn, layer, sources, logger, **options):
+        self.conn = conn
+        self.layer = layer
+        self.table = layer.lower()
+        self.sources = sources
+        self.logger = logger
+        self.entries = {}
+        self.timings = {}
+        self.counters = {}
+
+        for name, value in options.items():
+            if hasattr(self, name):
+                setattr(self, name, value)
+
+    def count(self, counter, value=1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def reader(self, files):
+        def open_member(extension):
+            if extension not in files:
+                return None
+            return io.BufferedReader(TimedReader(files[extension].open(), self.timings, self.counters))
+
+        encoding = 'utf-8'
+        if '.cpg' in files:
+            with files['.cpg'].open() as f:
+                encoding = f.read().decode('ascii', 'replace').strip() or encoding
+            # Code pages are given by number (e.g. 1257)
+            encoding = f'cp{encoding}' if encoding.isdigit() else encoding
+
+        return shapefile.Reader(shp=open_member('.shp'), dbf=open_member('.dbf'), shx=open_member('.shx'),
+                                encoding=encoding, encodingErrors='replace')
+
+    def lines(self, columns):
+        for files in self.sources:
+            name = files['.shp'].name
+            source = os.path.basename(files['.shp'].path)
+            with self.reader(files) as reader:
+                fields = [field[0].lower() for field in reader.fields[1:]]
+                unknown = set(fields) - columns.keys()
+                if unknown:
+                    self.logger.warning(f'Ignoring unknown field(s) {", ".join(sorted(unknown))} in {name}')
+                positions = [fields.index(column) if column in fields else None for column in columns]
+
+                i = 0
+                for record in timed_iter(reader.iterShapeRecords(), self.timings, 'parse'):
+                    i += 1
+                    values = [record.record[position] if position is not None else None for position in positions]
+                    values.append(source)
+                    shape = record.shape
+                    values.append(ewkb(shape.__geo_interface__, self.srid)
+                                  if shape.shapeType != shapefile.NULL else None)
+                    yield '\t'.join(CopyStream.format_value(value) for value in values) + '\n'
+
+            self.logger.debug(f'{i} feature(s) read from {name}')
+            self.count('rows_read', i)
+
+    def copy(self, cur, table, columns):
+        with timed(self.timings, 'write'):
+            cur.copy_expert(f'COPY {table} ({", ".join(columns)}, source, geom) FROM STDIN',
+                            CopyStream(timed_iter(self.lines(columns), self.timings, 'convert')))
+        exclusive(self.timings, ('read', 'parse', 'convert', 'write'))
+
+    def save_manifest(self, cur):
+        for archive, entry in self.entries.items():
+            save_manifest(cur, archive, self.layer, entry)
+
+    def process(self):
+        started = time.monotonic()
+        if not self.sources:
+            self.logger.warning(f'No shapefiles found for {self.layer}')
+            return
+
+        with self.reader(self.sources[0]) as reader:
+            columns = {field[0].lower(): column_type(*field[1:]) for field in reader.fields[1:]}
+            geometry_type = geometry_types.get(reader.shapeType, 'Geometry')
+
+        with self.conn.cursor() as cur:
+            cur.execute(f'DROP TABLE IF EXISTS {self.table}')
+            # Geometries are loaded in their own SRID, and are transformed once all of them have been loaded
+            cur.execute(f'CREATE TABLE {self.table} (gid serial PRIMARY KEY, '
+                        f'{", ".join(f"{column} {sql_type}" for column, sql_type in columns.items())}, '
+                        f'source varchar(128), geom geometry)')
+
+            self.logger.debug(f'Copying {len(self.sources)} shapefile(s) into {self.table}')
+            self.copy(cur, self.table, columns)
+            self.count('rows_written', cur.rowcount)
+
+            with timed(self.timings, 'write'):
+                self.logger.debug(f'Transforming {self.table} geometries into SRID {self.target_srid}')
+                cur.execute(f'ALTER TABLE {self.table} ALTER COLUMN geom TYPE geometry({geometry_type}, '
+                            f'{self.target_srid}) USING ST_Transform(geom, {self.target_srid})')
+
+            with timed(self.timings, 'index'):
+                self.logger.debug(f'Creating {self.table} geom and source indexes')
+                cur.execute(f'CREATE INDEX {self.table}_geom_idx ON {self.table} USING GIST (geom)')
+                cur.execute(f'CREATE INDEX {self.table}_source_idx ON {self.table} (source)')
+                cur.execute(f'ANALYZE {self.table}')
+
+            cur.execute('DELETE FROM kadastrs_archives WHERE layer = %s', (self.layer,))
+            self.save_manifest(cur)
+
+        elapsed = time.monotonic() - started
+        self.logger.info(f'{self.counters.get("rows_read", 0)} features loaded into {self.table} in {elapsed:.1f}s')
+
+    def replace(self, cur, archive):
+        """Replaces features of archive (with features of sources, if any) in the existing table"""
+        with timed(self.timings, 'write'):
+            cur.execute(f'DELETE FROM {self.table} WHERE source = %s', (archive,))
+            self.count('rows_deleted', cur.rowcount)
+
+        if self.sources:
+            cur.execute('SELECT column_name FROM information_schema.columns '
+                        'WHERE table_schema = current_schema() AND table_name = %s ORDER BY ordinal_position',
+                        (self.table,))
+            columns = {row[0]: None for row in cur.fetchall() if row[0] not in ('gid', 'source', 'geom')}
+
+            # Geometries are loaded in their own SRID into a staging table, and transformed when moved into the table
+            staging = f'{self.table}_staging'
+            cur.execute(f'CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS '
+                        f'SELECT {", ".join(columns)}, source, geom::geometry AS geom FROM {self.table} WITH NO DATA')
+            self.copy(cur, staging, columns)
+            with timed(self.timings, 'write'):
+                cur.execute(f'INSERT INTO {self.table} ({", ".join(columns)}, source, geom) '
+                            f'SELECT {", ".join(columns)}, source, ST_Transform(geom, {self.target_srid}) '
+                            f'FROM {staging}')
+                self.count('rows_written', cur.rowcount)
+                cur.execute(f'DROP TABLE {staging}')
+
+        if archive in self.entries:
+            save_manifest(cur, archive, self.layer, self.entries[archive])
+        else:
+            delete_manifest(cur, archive, self.layer)
+
+
+class TerritoryImporter:
+    """
+    Replaces features of a single territory archive in every given layer's table, in one transaction.
+
+    An archive without sources (that is not listed in the catalog anymore) has its features and manifest entries
+    deleted.
+    """
+    conn = None
+    logger = None
+    archive = None
+    layers = []
+    sources = {}
+    entry = None
+    timings = {}
+    counters = {}
+
+    def __init__(self, conn, archive, layers, sources, entry, logger, **options):
+        self.conn = conn
+        self.archive = archive
+        self.layers = layers
+        self.sources = sources
+        self.entry = entry
+        self.logger = logger
+        self.timings = {}
+        self.counters = {}
+
+        for name, value in options.items():
+            if hasattr(self, name):
+                setattr(self, name, value)
+
+    def process(self):
+        started = time.monotonic()
+        with self.conn.cursor() as cur:
+            for layer in self.layers:
+                importer = LayerImporter(self.conn, layer, self.sources.get(layer, []), self.logger,
+                                         entries={self.archive: self.entry} if self.entry else {},
+                                         timings=self.timings, counters=self.counters)
+                importer.replace(cur, self.archive)
+
+        elapsed = time.monotonic() - started
+        self.logger.info(f'{self.counters.get("rows_deleted", 0)} features of {self.archive} replaced with '
+                         f'{self.counters.get("rows_written", 0)} in {len(self.layers)} layer(s) in {elapsed:.1f}s')
@@ -1,19 +1,29 @@
 #!/usr/bin/env python3
 
+import contextlib
+import functools
 import inspect
 import logging
 import os.path
 import argparse
+import sys
+import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from os import environ
-import psycopg2
 
 import httpx
 
-from defs import get_file_importer
+from download import DownloadError, catalog_uris, check_updates, download
+from metrics import RunReport, profiled, timed
+from pipeline import FanOut
+from scheduler import Scheduler
 
 SCRIPT_PATH = os.path.dirname(os.path.abspath(inspect.getframeinfo(inspect.currentframe()).filename))
 DATA_PATH = f'{SCRIPT_PATH}/data'
+ROOT_TAGS_FILE = f'{DATA_PATH}/root_tags.json'
+PROFILE_PATH = f'{DATA_PATH}/profiles'
+KADASTRS_PATH = f'{DATA_PATH}/kadastrs'
 BASE_URI = 'https://data.gov.lv/dati/dataset/'
 
 uris = {
@@ -38,6 +48,10 @@ uris = {
     },
 }
 
+# Parcel shapefiles, archives are listed in the dataset's JSON-LD catalog
+# https://data.gov.lv/dati/lv/dataset/kadastra-informacijas-sistemas-atverti-telpiskie-dati
+KADASTRS_CATALOG_URI = 'https://data.gov.lv/dati/lv/dataset/b28f0eed-73b0-4e44-94e7-b04b11bf0b69.jsonld'
+
 args_parser = argparse.ArgumentParser(
     description="""
 Downloads and imports Valsts Zemes Dienests address database into postgis enabled postgresql database. 
@@ -50,6 +64,9 @@ VZD_DBNAME=vzd ./import.py --verbose
 """, formatter_class=argparse.RawTextHelpFormatter)
 args_parser.add_argument('--force-import', action='store_true',
                          help='Force import of data even if it has not been changed')
+args_parser.add_argument('--check', action='store_true',
+                         help='Check all archives for changes concurrently first, and exit without connecting to the '
+                              'database if none of them has been changed')
 args_parser.add_argument('--verbose', action='store_true', help='Loglevel = DEBUG')
 args_parser.add_argument('--quiet', action='store_true', help='Loglevel = ERROR')
 args_parser.add_argument('--only',
@@ -57,16 +74,109 @@ args_parser.add_argument('--only',
                               'to be archived file name (aw_iela.csv, etc), for kadastrs metadata it is zip name '
                               '(mark.zip, etc)')
 args_parser.add_argument('--groups',
-                         help='Comma separated list of groups to process. Defaults to "addresses,parcels"',
+                         help='Comma separated list of groups to process: addresses, parcels (metadata), kadastrs '
+                              '(parcel shapefiles). Defaults to "addresses,parcels"',
                          default='addresses,parcels')
+args_parser.add_argument('--bulk', action='store_true',
+                         help='Load address CSV files with COPY into a staging table and merge them in a single '
+                              'statement instead of upserting row by row')
+args_parser.add_argument('--stream-xml', action='store_true',
+                         help='Parse parcel metadata XML files incrementally, keeping memory usage constant '
+                              'regardless of file size')
+args_parser.add_argument('--parse-workers', type=int, default=0, metavar='N',
+                         help='Parse and convert parcel metadata XML files in N processes, in chunks of whole items '
+                              '(see "Parcel metadata import" in README.md). Defaults to 0, in the importing thread')
+args_parser.add_argument('--pipelined', action='store_true',
+                         help='Read, parse and convert rows of a file in a separate thread, while writing them to the '
+                              'database')
+args_parser.add_argument('--commit-every', type=int, default=0, metavar='N',
+                         help='Commit every N rows of a file along with a checkpoint, instead of a transaction per '
+                              'file (see "Resuming imports" in README.md)')
+args_parser.add_argument('--resume', action='store_true',
+                         help='Continue interrupted imports from their last checkpoint and skip files which have been '
+                              'imported completely, importing downloaded archives even if they have not changed')
+args_parser.add_argument('--delta', action='store_true',
+                         help='Write only rows whose content hash has changed and delete only rows which are missing, '
+                              'instead of rewriting whole tables')
+args_parser.add_argument('--changes', action='store_true',
+                         help='Record inserted, updated and deleted rows (with changed values) of each table in '
+                              'vzd_changes, under the id of the run (see "Change data capture" in README.md)')
+args_parser.add_argument('--changes-path',
+                         help='Also write changes recorded by the run into <run id>.ndjson in this directory, implies '
+                              '--changes')
+args_parser.add_argument('--incremental-view', action='store_true',
+                         help='Recompute only affected rows of aw_full_addresses (has to be a table, see schema.sql) '
+                              'instead of refreshing it as a whole, requires --delta')
+args_parser.add_argument('--strategy', choices=['merge', 'swap', 'auto'], default='merge',
+                         help='How to load address tables: merge rows in place, swap in a fully loaded and indexed '
+                              'shadow table, or choose by the share of changed rows (auto). Defaults to merge')
+args_parser.add_argument('--geom-source', choices=['latlng', 'xy'], default='latlng',
+                         help='Build house geometry from published WGS 84 coordinates (latlng), or from native LKS-92 '
+                              'coordinates transformed by PostGIS (xy). Defaults to latlng')
+args_parser.add_argument('--native-geom', action='store_true',
+                         help='Also store house geometry in LKS-92 (EPSG:3059) in geom_3059 column')
+args_parser.add_argument('--target', action='append', metavar='NAME=CONNECTION',
+                         help='Import into this database, named NAME, given by a libpq connection string (e.g. '
+                              '"dbname=vzd_reporting host=replica") overriding VZD_* environment variables. Can be '
+                              'given several times, files are then parsed once and written to every database in '
+                              'parallel (see "Several target databases" in README.md)')
+args_parser.add_argument('--jobs', type=int, default=1,
+                         help='Number of files to import in parallel (into each target database), each over its own '
+                              'database connection. Defaults to 1')
+args_parser.add_argument('--download-jobs', type=int, default=4,
+                         help='Number of parcel shapefile archives to download in parallel. Defaults to 4')
+args_parser.add_argument('--export-path',
+                         help='Also export imported rows into a columnar file per table (partitioned by status or '
+                              'object type) in this directory, pyarrow has to be installed')
+args_parser.add_argument('--export-format', choices=['parquet', 'arrow'], default='parquet',
+                         help='Format of --export-path files: parquet or arrow (IPC file). Defaults to parquet')
+args_parser.add_argument('--snapshot',
+                         help='Export aw_full_addresses into this memory-mapped snapshot file for lookups without '
+                              'database (see snapshot.py), after addresses have been imported')
+args_parser.add_argument('--report',
+                         help='Write timings per stage and file, counters and rates of the run to this JSON file')
+args_parser.add_argument('--prometheus',
+                         help='Write the same metrics to this file for node_exporter textfile collector (*.prom)')
+args_parser.add_argument('--profile',
+                         help='Comma separated list of importers (HousesImporter, etc) or files (aw_eka.csv, etc) to '
+                              f'profile, "all" for all of them. Profiles are written to {PROFILE_PATH}')
+args_parser.add_argument('--profiler', choices=['cprofile', 'pyinstrument'], default='cprofile',
+                         help='Profiler to use with --profile, pyinstrument has to be installed. Defaults to cprofile')
 
 args = args_parser.parse_args()
+if args.incremental_view and not args.delta:
+    # Without --delta every row is recorded as changed, and the table would be rebuilt as a whole
+    args_parser.error('--incremental-view requires --delta')
 
 FORCE_IMPORT = args.force_import
+JOBS = max(args.jobs, 1)
+# Target database name => connection string, a single unnamed database given by environment variables by default
+TARGETS = dict(target.partition('=')[::2] for target in args.target) if args.target else {None: ''}
+# Database snapshot, changes and the parcel shapefile manifest are read from, and columnar export is written for
+PRIMARY_TARGET = next(iter(TARGETS))
+DOWNLOAD_JOBS = max(args.download_jobs, 1)
 GROUPS = args.groups.split(',')
+# Id of the run changes are recorded under
+RUN_ID = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+IMPORTER_OPTIONS = {
+    'bulk': args.bulk,
+    'stream': args.stream_xml,
+    'parse_workers': max(args.parse_workers, 0),
+    'pipelined': args.pipelined,
+    'commit_every': max(args.commit_every, 0),
+    'resume': args.resume,
+    'delta': args.delta,
+    'changes': RUN_ID if args.changes or args.changes_path else None,
+    'incremental_view': args.incremental_view,
+    'strategy': args.strategy,
+    'geom_source': args.geom_source,
+    'native_geom': args.native_geom,
+    'export_path': args.export_path,
+    'export_format': args.export_format,
+}
 
-if args.only is not None:
-    FILES = args.only.split(',')
+FILES = args.only.split(',') if args.only is not None else []
+PROFILE = args.profile.split(',') if args.profile is not None else []
 if args.verbose:
     LOGLEVEL = logging.DEBUG
 elif args.quiet:
@@ -82,42 +192,53 @@ for param in ['dbname', 'user', 'password', 'host', 'port']:
 logger = logging.getLogger(__name__)
 logger.setLevel(LOGLEVEL)
 handler = logging.StreamHandler()
-handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s', datefmt='%Y-%m-%d %I:%M:%S'))
+handler.setFormatter(logging.Formatter(
+    '%(asctime)s [%(levelname)s] ' + ('[%(threadName)s] ' if JOBS > 1 or len(TARGETS) > 1 else '') + '%(message)s',
+    datefmt='%Y-%m-%d %I:%M:%S'))
 logger.addHandler(handler)
 
-conn = psycopg2.connect(PSQL_CONNECTION_STRING)
+report = RunReport()
 
+# URIs checked by --check and those of them found to be updated, other checked ones are not requested again
+checked_uris = None
+updated_uris = None
 
-def downloaded(uri):
-    logger.debug(f'Checking to download {uri}')
-    target_file_name = f'{DATA_PATH}/{os.path.basename(uri)}'
-    etag_file_name = f'{target_file_name}.etag'
 
-    headers = {}
+def connect(target=PRIMARY_TARGET):
+    import psycopg2
 
-    if os.path.exists(target_file_name) and os.path.exists(etag_file_name):
-        with open(etag_file_name, 'r+') as f:
-            headers['If-None-Match'] = f.read(1024)
-            logger.debug('Etag: %s' % headers['If-None-Match'])
+    # Later parameters override earlier ones
+    return psycopg2.connect(PSQL_CONNECTION_STRING + TARGETS[target])
 
-    response = httpx.get(uri, headers=headers)
-
-    if response.status_code == 200:
-        logger.info(f'File {target_file_name} updated')
 
-        if 'etag' in response.headers:
-            logger.debug('New etag: %s' % response.headers['etag'])
-            with open(etag_file_name, 'w+') as f:
-                f.write(response.headers['etag'])
+def for_target(name, target):
+    """Returns name (of a job, etc) qualified with name of the target database, if importing into named ones"""
+    return f'{target}:{name}' if target is not None else name
 
-        with open(target_file_name, 'wb+') as f:
-            f.write(response.content)
 
-        return True
+def downloaded(uri, path=DATA_PATH):
+    # URIs that have not been checked (archives newly listed by a changed catalog) are downloaded as usual
+    if updated_uris is not None and uri in checked_uris and uri not in updated_uris:
+        return False
 
-    logger.debug('File not modified')
+    logger.debug(f'Checking to download {uri}')
+    target_file_name = f'{path}/{os.path.basename(uri)}'
+
+    timings, counters = {}, {}
+    try:
+        with timed(timings, 'download'):
+            updated = download(uri, target_file_name, logger, counters=counters)
+    except (DownloadError, httpx.HTTPError, OSError) as e:
+        # Writing the file may fail as well (disk full, permissions), the file is then not imported, like on HTTP errors
+        logger.error(f'Failed to download {uri}: {e}')
+        return False
+    finally:
+        report.record(os.path.basename(uri), timings, counters)
+
+    if updated:
+        logger.info(f'File {target_file_name} updated')
 
-    return False
+    return updated
 
 
 def should_skip(file):
@@ -125,33 +246,240 @@ def should_skip(file):
         return any([x.lower().endswith('.zip') for x in FILES]) and file.lower() not in [x.lower() for x in FILES]
     elif file.lower().endswith('.csv'):
         return any([x.lower().endswith('.csv') for x in FILES]) and file.lower() not in [x.lower() for x in FILES]
+    elif file.lower().startswith('kk'):
+        return any([x.lower().startswith('kk') for x in FILES]) and file.lower() not in [x.lower() for x in FILES]
     return False
 
 
-def process_archive(file_name):
-    if should_skip(file_name):
-        logger.debug(f'Skipping {file_name}')
-        return
-    with zipfile.ZipFile(f'{DATA_PATH}/{file_name}', 'r') as zip:
-        logger.debug(f'Extracting files to {DATA_PATH}')
-        zip.extractall(DATA_PATH)
+def should_profile(name, importer_class):
+    return 'all' in PROFILE or importer_class.__name__ in PROFILE or any(part in PROFILE for part in name.split('/'))
+
+
+def importer_factory(importer_class, member, target=PRIMARY_TARGET, **options):
+    if target != PRIMARY_TARGET:
+        # Rows written into every target are the same, they are exported once
+        options['export_path'] = None
+    return functools.partial(importer_class, file=member, logger=logger, **(IMPORTER_OPTIONS | options),
+                             defer_postprocess=True)
+
+
+def import_job(name, create_importer, postprocess=False, feed=None):
+    """Returns a job running importer created by create_importer(conn=conn), which iterates over feed (if given)"""
+    def run(conn):
+        started = time.perf_counter()
+        try:
+            importer = create_importer(conn=conn)
+        except Exception:
+            if feed:
+                feed.close()
+            raise
+        try:
+            with profiled(name, PROFILE_PATH, args.profiler) if should_profile(name, create_importer.func) \
+                    else contextlib.nullcontext():
+                if postprocess:
+                    importer.postprocess()
+                else:
+                    importer.process()
+        finally:
+            if feed:
+                # Importer which has failed (or has not needed rows of the file at all) holds back no other target
+                feed.close()
+            # Time not accounted to any stage (bookkeeping between stages, logging)
+            other = time.perf_counter() - started - sum(importer.timings.values())
+            report.record(name, importer.timings | {'other': max(other, 0)}, importer.counters)
+
+    return run
+
+
+def schedule_archive(scheduler, zip):
+    """
+    Adds a job for every importable archive member and target database, returns (job name, importer class, member,
+    target) tuples. Jobs of a member share rows of it, produced once (see FanOut), if there are several targets.
+    """
+    from defs import ArchiveMember, get_file_importer
+
+    imports = []
+    for info in zip.infolist():
+        if info.is_dir():
+            continue
+        if should_skip(info.filename):
+            logger.debug(f'Skipping {info.filename}')
+            continue
+
+        member = ArchiveMember(zip, info)
+        importer_class = get_file_importer(member)
+        if importer_class:
+            logger.info(f'Using importer {importer_class.__name__} to import {info.filename}')
+            name = f'{os.path.basename(zip.filename)}/{info.filename}'
+            fanout = FanOut(name, TARGETS, logger) if len(TARGETS) > 1 else None
+            for target in TARGETS:
+                job = for_target(name, target)
+                feed = fanout.feeds[target] if fanout else None
+                scheduler.add(job, import_job(job, importer_factory(importer_class, member, target, feed=feed),
+                                              feed=feed), target=target)
+                imports.append((job, importer_class, member, target))
+        else:
+            logger.warning(f'Unknown file {info.filename}')
 
-        for file in zip.filelist:
-            importer_class = get_file_importer(f'{DATA_PATH}/{file.filename}')
-            if should_skip(file.filename):
-                logger.debug(f'Skipping {file.filename}')
-            elif importer_class:
-                logger.info(f'Using importer {importer_class.__name__} to import {file.filename}')
-                importer = importer_class(conn=conn, file=f'{DATA_PATH}/{file.filename}', logger=logger)
-                importer.process()
-            else:
-                logger.warning(f'Unknown file {file.filename}')
+    return imports
 
-            logger.debug(f'Removing {DATA_PATH}/{file.filename}')
-            # os.unlink(f'{DATA_PATH}/{file.filename}')
+
+def schedule_postprocessing(scheduler, imports):
+    for name, importer_class, member, target in imports:
+        if getattr(importer_class, 'postprocess_after', ()):
+            after = [other for other, other_class, _, other_target in imports
+                     if other_target == target and issubclass(other_class, importer_class.postprocess_after)]
+            job = import_job(f'{name} postprocess', importer_factory(importer_class, member, target), postprocess=True)
+            scheduler.add(f'{name} postprocess', job, after, target=target)
+
+
+def schedule_kadastrs(scheduler, archives):
+    """
+    Downloads parcel shapefile archives, and adds a job for every layer that has to be imported as a whole, and for
+    every archive whose features have to be replaced, as it has changed since it was imported (or has been removed)
+    """
+    from kadastrs import LAYERS
+
+    os.makedirs(KADASTRS_PATH, exist_ok=True)
+    downloaded(KADASTRS_CATALOG_URI, path=KADASTRS_PATH)
+    try:
+        catalog = catalog_uris(f'{KADASTRS_PATH}/{os.path.basename(KADASTRS_CATALOG_URI)}')
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f'Failed to get parcel shapefile list: {e}')
+        return
+    uris = [uri for uri in catalog if not should_skip(os.path.basename(uri))]
+
+    logger.info(f'Checking {len(uris)} parcel shapefile archive(s)')
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_JOBS, thread_name_prefix='download') as pool:
+        list(pool.map(functools.partial(downloaded, path=KADASTRS_PATH), uris))
+
+    layers = [layer for layer in LAYERS if not should_skip(layer)]
+    # Archives opened for any of the target databases
+    territories = {}
+    for target in TARGETS:
+        schedule_territories(scheduler, target, catalog, uris, layers, territories)
+    archives += territories.values()
+
+
+def schedule_territories(scheduler, target, catalog, uris, layers, territories):
+    """
+    Adds jobs importing parcel shapefile layers (as a whole) or archives (replacing their features) into target
+    database, as of its manifest, opening archives into territories (archive => ZipFile) as needed
+    """
+    from kadastrs import (LayerImporter, TerritoryImporter, archive_entry, imported_layers, layer_sources,
+                          load_manifest, save_manifest)
+
+    entries = {}
+    changed = {}
+    conn = connect(target)
+    try:
+        with conn.cursor() as cur:
+            manifest = load_manifest(cur)
+            # Layers not imported yet (or imported before features were tagged with their archive) are imported as a
+            # whole, other ones only have features of changed archives replaced
+            full = [layer for layer in layers if FORCE_IMPORT or layer not in imported_layers(cur)]
+            for uri in uris:
+                archive = os.path.basename(uri)
+                file_name = f'{KADASTRS_PATH}/{archive}'
+                if not os.path.exists(file_name):
+                    continue
+                previous = [manifest[(archive, layer)] for layer in layers if (archive, layer) in manifest]
+                entry = entries[archive] = archive_entry(file_name, previous[0] if previous else None)
+                for layer in layers:
+                    if layer in full:
+                        continue
+                    if manifest.get((archive, layer), {}).get('sha256') != entry['sha256']:
+                        changed.setdefault(archive, []).append(layer)
+                    elif manifest[(archive, layer)] != entry:
+                        # Same content downloaded again, only remember its new file key (and ETag)
+                        save_manifest(cur, archive, layer, entry)
+        conn.commit()
+    finally:
+        conn.close()
+
+    removed = {}
+    for archive, layer in manifest:
+        if archive not in {os.path.basename(uri) for uri in catalog} and layer in layers and layer not in full:
+            removed.setdefault(archive, []).append(layer)
+
+    if not full and not changed and not removed:
+        logger.info('Parcel shapefiles have not been changed')
+        return
+
+    opened = {}
+    for archive in entries:
+        if full or archive in changed:
+            if archive not in territories:
+                territories[archive] = zipfile.ZipFile(f'{KADASTRS_PATH}/{archive}', 'r')
+            opened[archive] = territories[archive]
+
+    sources = layer_sources(opened.values())
+    for layer in full:
+        name = for_target(f'kadastrs/{layer}', target)
+        scheduler.add(name, import_job(name, functools.partial(LayerImporter, layer=layer,
+                                                               sources=sources.get(layer, []), entries=entries,
+                                                               logger=logger)), target=target)
+
+    for archive, archive_layers in changed.items():
+        logger.info(f'Replacing features of {archive} in {len(archive_layers)} layer(s)')
+        name = for_target(f'kadastrs/{archive}', target)
+        scheduler.add(name, import_job(name, functools.partial(
+            TerritoryImporter, archive=archive, layers=archive_layers, sources=layer_sources([territories[archive]]),
+            entry=entries[archive], logger=logger)), target=target)
+
+    for archive, archive_layers in removed.items():
+        logger.info(f'Deleting features of {archive}, as it is not listed anymore')
+        name = for_target(f'kadastrs/{archive}', target)
+        scheduler.add(name, import_job(name, functools.partial(
+            TerritoryImporter, archive=archive, layers=archive_layers, sources={}, entry=None, logger=logger)),
+                      target=target)
+
+
+def check():
+    """
+    Returns URIs of archives (of the groups to be processed) which have been checked, and those of them which have been
+    updated since they were downloaded
+    """
+    targets = {}
+    for group, group_uris in uris.items():
+        if group in GROUPS:
+            for uri in group_uris:
+                if not should_skip(os.path.basename(uri)):
+                    targets[BASE_URI + uri] = f'{DATA_PATH}/{os.path.basename(uri)}'
+    if 'kadastrs' in GROUPS:
+        catalog_file_name = f'{KADASTRS_PATH}/{os.path.basename(KADASTRS_CATALOG_URI)}'
+        targets[KADASTRS_CATALOG_URI] = catalog_file_name
+        if os.path.exists(catalog_file_name):
+            # Archives listed by the catalog downloaded previously (if it has changed, it is downloaded anyway)
+            for uri in catalog_uris(catalog_file_name):
+                if not should_skip(os.path.basename(uri)):
+                    targets[uri] = f'{KADASTRS_PATH}/{os.path.basename(uri)}'
+
+    logger.debug(f'Checking {len(targets)} file(s) for changes')
+    return set(targets), check_updates(targets, logger, connections=max(DOWNLOAD_JOBS, 16))
 
 
 if __name__ == '__main__':
+    if args.check and not FORCE_IMPORT and not args.resume:
+        timings = {}
+        with timed(timings, 'download'):
+            checked_uris, updated_uris = check()
+        report.record('check', timings, {'files_updated': len(updated_uris)})
+        if not updated_uris and (not args.snapshot or os.path.exists(args.snapshot)):
+            logger.info('Nothing has been updated')
+            if args.report:
+                report.write_json(args.report, True)
+            if args.prometheus:
+                report.write_prometheus(args.prometheus, True)
+            sys.exit(0)
+        logger.info(f'{len(updated_uris)} file(s) updated')
+
+    from defs import export_changes, load_root_tags, save_root_tags
+
+    load_root_tags(ROOT_TAGS_FILE)
+    scheduler = Scheduler(connect, logger, workers=JOBS)
+    archives = []
+    imports = []
     for group, uris in uris.items():
         if group in GROUPS:
             for uri in uris:
@@ -159,7 +487,45 @@ if __name__ == '__main__':
                 if should_skip(os.path.basename(uri)):
                     logger.debug(f'Skipping {uri}')
                     continue
-                if downloaded(uri) or FORCE_IMPORT:
-                    process_archive(os.path.basename(uri))
+                if downloaded(uri) or FORCE_IMPORT or args.resume:
+                    archives.append(zipfile.ZipFile(f'{DATA_PATH}/{os.path.basename(uri)}', 'r'))
+                    imports += schedule_archive(scheduler, archives[-1])
         else:
             logger.debug(f'Skipping group {group}')
+    if 'kadastrs' in GROUPS:
+        schedule_kadastrs(scheduler, archives)
+
+    schedule_postprocessing(scheduler, imports)
+    succeeded = scheduler.run()
+    scheduler.summary()
+
+    for archive in archives:
+        archive.close()
+    save_root_tags(ROOT_TAGS_FILE)
+
+    if args.changes_path and imports:
+        conn = connect()
+        try:
+            export_changes(conn, args.changes_path, RUN_ID, logger)
+        finally:
+            conn.close()
+
+    if args.snapshot and succeeded and (imports or not os.path.exists(args.snapshot)):
+        import snapshot
+
+        conn = connect()
+        timings = {}
+        try:
+            with timed(timings, 'write'):
+                snapshot.export(conn, args.snapshot, logger)
+            report.record('snapshot', timings)
+        finally:
+            conn.close()
+
+    if args.report:
+        report.write_json(args.report, succeeded)
+    if args.prometheus:
+        report.write_prometheus(args.prometheus, succeeded)
+
+    if not succeeded:
+        sys.exit(1)
@@ -0,0 +1,194 @@
+import contextlib
+import cProfile
+import io
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+
+def add_time(timings, stage, elapsed):
+    timings[stage] = timings.get(stage, 0) + elapsed
+
+
+@contextlib.contextmanager
+def timed(timings, stage):
+    """Adds time spent within the block to timings[stage]"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(timings, stage, time.perf_counter() - started)
+
+
+def timed_iter(iterable, timings, stage):
+    """
+    Yields items of iterable, adding time spent producing them to timings[stage].
+
+    Stages of a streaming pipeline run interleaved, so time of a stage is measured inclusive of the stages it pulls
+    items from, and has to have their time subtracted (see exclusive()).
+    """
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            add_time(timings, stage, time.perf_counter() - started)
+        yield item
+
+
+def exclusive(timings, stages):
+    """Turns inclusive timings of nested stages (innermost first) into exclusive ones"""
+    inner = 0
+    for stage in stages:
+        if stage in timings:
+            timings[stage], inner = max(timings[stage] - inner, 0), timings[stage]
+
+
+class TimedReader(io.RawIOBase):
+    """Binary stream over another one, counting bytes read and time spent reading (and decompressing) them"""
+
+    def __init__(self, stream, timings, counters, stage='read'):
+        self.stream = stream
+        self.timings = timings
+        self.counters = counters
+        self.stage = stage
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self.stream.seekable()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.stream.seek(offset, whence)
+
+    def tell(self):
+        return self.stream.tell()
+
+    def readinto(self, buffer):
+        started = time.perf_counter()
+        data = self.stream.read(len(buffer))
+        add_time(self.timings, self.stage, time.perf_counter() - started)
+        buffer[:len(data)] = data
+        self.counters['bytes_read'] = self.counters.get('bytes_read', 0) + len(data)
+
+        return len(data)
+
+    def close(self):
+        self.stream.close()
+        super().close()
+
+
+# cProfile (sys.setprofile based) profiles a single thread, and only one profiler can be active at a time
+profile_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def profiled(name, directory, profiler='cprofile'):
+    """Profiles the block, writing results into directory as <name>.prof (cProfile) or <name>.html (pyinstrument)"""
+    os.makedirs(directory, exist_ok=True)
+    file_name = os.path.join(directory, name.replace('/', '_'))
+    with profile_lock:
+        if profiler == 'pyinstrument':
+            import pyinstrument
+
+            profile = pyinstrument.Profiler()
+            profile.start()
+            try:
+                yield
+            finally:
+                profile.stop()
+                with open(f'{file_name}.html', 'w') as f:
+                    f.write(profile.output_html())
+        else:
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                profile.dump_stats(f'{file_name}.prof')
+
+
+class RunReport:
+    """Timings (seconds) per stage and counters per file of a run, written out as JSON and Prometheus textfile"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, timings=None, counters=None):
+        with self.lock:
+            entry = self.files.setdefault(name, {'timings': {}, 'counters': {}})
+            for stage, elapsed in (timings or {}).items():
+                add_time(entry['timings'], stage, elapsed)
+            for counter, value in (counters or {}).items():
+                entry['counters'][counter] = entry['counters'].get(counter, 0) + value
+
+    def as_dict(self, succeeded=None):
+        files = {}
+        for name, entry in self.files.items():
+            elapsed = sum(entry['timings'].values())
+            rates = {f'{counter}_per_second': round(value / elapsed, 1)
+                     for counter, value in entry['counters'].items() if elapsed and counter.startswith('rows_')}
+            files[name] = {
+                'timings': {stage: round(elapsed, 3) for stage, elapsed in entry['timings'].items()},
+                'counters': entry['counters'],
+                'rates': rates,
+            }
+
+        stages = {}
+        for entry in self.files.values():
+            for stage, elapsed in entry['timings'].items():
+                add_time(stages, stage, elapsed)
+
+        return {
+            'started': datetime.fromtimestamp(self.started, timezone.utc).isoformat(timespec='seconds'),
+            'elapsed': round(time.time() - self.started, 3),
+            'succeeded': succeeded,
+            'stages': {stage: round(elapsed, 3) for stage, elapsed in stages.items()},
+            'files': files,
+        }
+
+    def write_json(self, file_name, succeeded=None):
+        with open(file_name, 'w') as f:
+            json.dump(self.as_dict(succeeded), f, indent=2)
+
+    def write_prometheus(self, file_name, succeeded=None):
+        """Writes metrics in the format of node_exporter's textfile collector, replacing the file atomically"""
+        def label(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        lines = [
+            '# HELP vzd_import_stage_seconds Time spent in an import stage',
+            '# TYPE vzd_import_stage_seconds gauge',
+        ]
+        for name, entry in self.files.items():
+            for stage, elapsed in entry['timings'].items():
+                lines.append(f'vzd_import_stage_seconds{{file="{label(name)}",stage="{label(stage)}"}} {elapsed:.6f}')
+
+        counters = sorted({counter for entry in self.files.values() for counter in entry['counters']})
+        for counter in counters:
+            lines.append(f'# TYPE vzd_import_{counter} gauge')
+            for name, entry in self.files.items():
+                if counter in entry['counters']:
+                    lines.append(f'vzd_import_{counter}{{file="{label(name)}"}} {entry["counters"][counter]}')
+
+        lines += [
+            '# TYPE vzd_import_last_run_timestamp_seconds gauge',
+            f'vzd_import_last_run_timestamp_seconds {self.started:.0f}',
+            '# TYPE vzd_import_last_run_duration_seconds gauge',
+            f'vzd_import_last_run_duration_seconds {time.time() - self.started:.3f}',
+        ]
+        if succeeded is not None:
+            lines += ['# TYPE vzd_import_last_run_success gauge', f'vzd_import_last_run_success {int(succeeded)}']
+
+        with open(f'{file_name}.tmp', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(f'{file_name}.tmp', file_name)
@@ -0,0 +1,230 @@
+import queue
+import threading
+import time
+
+from metrics import add_time
+
+DONE = object()
+
+
+class Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+class Pipeline:
+    """
+    Iterates over items of iterable, which is consumed in a producer thread and handed over in batches through a
+    bounded queue, so that producing items (reading, parsing and converting rows) overlaps with consuming them (writing
+    rows to the database).
+
+    Producer blocks while the queue is full, time it waits is added to timings['producer_stall'] (consumer being the
+    bottleneck), time consumer waits for a batch to timings['writer_stall'] (producer being the bottleneck). An exception
+    raised by the producer is raised by the consumer once it gets to the failed batch. Leaving the pipeline (with
+    statement) stops the producer and waits for it to finish.
+    """
+
+    def __init__(self, iterable, timings, batch_size=1000, queue_size=16):
+        self.iterable = iterable
+        self.timings = timings
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.produce, name=f'{threading.current_thread().name}-producer',
+                                       daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        # Unblock producer waiting for space in the queue
+        while self.thread.is_alive():
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.thread.join()
+
+    def put(self, item):
+        """Puts item into the queue, returns False if the pipeline has been stopped in the meantime"""
+        started = time.perf_counter()
+        try:
+            while not self.stopped.is_set():
+                try:
+                    self.queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        finally:
+            add_time(self.timings, 'producer_stall', time.perf_counter() - started)
+
+    def produce(self):
+        try:
+            batch = []
+            for item in self.iterable:
+                if self.stopped.is_set():
+                    return
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    if not self.put(batch):
+                        return
+                    batch = []
+            if batch and not self.put(batch):
+                return
+            self.put(DONE)
+        except BaseException as e:
+            self.put(Failure(e))
+
+    def __iter__(self):
+        while True:
+            started = time.perf_counter()
+            batch = self.queue.get()
+            add_time(self.timings, 'writer_stall', time.perf_counter() - started)
+            if batch is DONE:
+                return
+            if isinstance(batch, Failure):
+                raise batch.error
+            yield from batch
+
+
+class Feed:
+    """Items of a FanOut for one of its consumers (see FanOut.feeds)"""
+
+    def __init__(self, fanout, name, queue_size):
+        self.fanout = fanout
+        self.name = name
+        self.queue = queue.Queue(maxsize=queue_size)
+        # 'waiting' to be iterated over, 'attached' to the producer, 'detached' from it, or 'closed' by the consumer
+        self.state = 'waiting'
+
+    def items(self, produce, timings):
+        """
+        Yields items of the fan-out, produced by produce(0) in the producer thread if this is the first feed to be
+        iterated over. Once detached from the producer, continues with produce(position) of its own.
+        """
+        if not self.fanout.attach(self, produce):
+            yield from produce(0)
+            return
+
+        position = 0
+        while True:
+            started = time.perf_counter()
+            batch = self.get()
+            add_time(timings, 'writer_stall', time.perf_counter() - started)
+            if batch is None:
+                yield from produce(position)
+                return
+            if batch is DONE:
+                return
+            if isinstance(batch, Failure):
+                raise batch.error
+            position += len(batch)
+            yield from batch
+
+    def get(self):
+        """Returns the next batch, or None if the feed has been detached and its queued batches consumed"""
+        while True:
+            try:
+                return self.queue.get(timeout=0.1)
+            except queue.Empty:
+                # Nothing is put into the queue once detached
+                if self.state == 'detached':
+                    return None
+
+    def close(self):
+        """Stops feeding the consumer, e.g. as it has failed (or has not needed the items at all)"""
+        with self.fanout.lock:
+            self.state = 'closed'
+            self.fanout.lock.notify_all()
+        # Unblock producer waiting for space in the queue
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+
+class FanOut:
+    """
+    Iterates over items of an iterable once for several consumers (importers of the same file into different databases),
+    each of them iterating over its own feed in a thread of its own.
+
+    Items are consumed in a producer thread, started by the first feed iterated over, and handed over in batches through
+    a bounded queue per feed. Producer waits up to start_timeout seconds for the other feeds to be iterated over, and up
+    to detach_after seconds for space in the queue of a feed, before detaching it, so that a consumer which has not
+    started yet (still importing a previous file) or has fallen behind does not hold the others back: it continues by
+    producing the remaining items on its own (e.g. reading the file once more). Consumers which have stopped (closed
+    their feed) are not fed anymore, the producer stops once none are left.
+    """
+
+    def __init__(self, name, consumers, logger, batch_size=1000, queue_size=64, start_timeout=1, detach_after=30):
+        self.name = name
+        self.logger = logger
+        self.batch_size = batch_size
+        self.start_timeout = start_timeout
+        self.detach_after = detach_after
+        self.feeds = {consumer: Feed(self, consumer, queue_size) for consumer in consumers}
+        self.lock = threading.Condition()
+        self.thread = None
+
+    def attach(self, feed, produce):
+        """Attaches feed to the producer (started with produce(0) if not running yet), returns False if detached"""
+        with self.lock:
+            if feed.state != 'waiting':
+                return False
+            feed.state = 'attached'
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.produce, args=(produce,),
+                                               name=f'{threading.current_thread().name}-producer', daemon=True)
+                self.thread.start()
+            self.lock.notify_all()
+
+            return True
+
+    def attached(self):
+        return [feed for feed in self.feeds.values() if feed.state == 'attached']
+
+    def detach(self, feed, reason):
+        with self.lock:
+            if feed.state in ('waiting', 'attached'):
+                feed.state = 'detached'
+                self.logger.warning(f'{feed.name} {reason}, it reads {self.name} on its own')
+
+    def put(self, batch):
+        """Puts batch into queues of attached feeds, returns False if there are none left"""
+        for feed in self.attached():
+            deadline = time.monotonic() + self.detach_after
+            while feed.state == 'attached':
+                try:
+                    feed.queue.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    if time.monotonic() > deadline:
+                        self.detach(feed, 'has fallen behind')
+
+        return bool(self.attached())
+
+    def produce(self, produce):
+        with self.lock:
+            self.lock.wait_for(lambda: all(feed.state != 'waiting' for feed in self.feeds.values()),
+                               timeout=self.start_timeout)
+        for feed in list(self.feeds.values()):
+            if feed.state == 'waiting':
+                self.detach(feed, 'has not started in time')
+
+        try:
+            batch = []
+            for item in produce(0):
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    if not self.put(batch):
+                        return
+                    batch = []
+            if batch and not self.put(batch):
+                return
+            self.put(DONE)
+        except BaseException as e:
+            self.put(Failure(e))
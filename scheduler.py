@@ -0,0 +1,138 @@
+import contextlib
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Job:
+    def __init__(self, name, run, after=(), target=None):
+        self.name = name
+        self.run = run
+        self.after = set(after)
+        self.target = target
+        self.status = 'pending'
+        self.elapsed = None
+        self.error = None
+
+
+class Scheduler:
+    """
+    Runs import jobs in a pool of worker threads, each worker with its own database connection. Jobs given a target
+    database (connected to with connect(target)) run in a pool of workers per target, so that targets progress at their
+    own pace.
+
+    Job is started once all jobs listed in its `after` are done, and is skipped if any of them fails. Every job runs in
+    its own transaction, which is committed when the job succeeds and rolled back otherwise.
+    """
+
+    def __init__(self, connect, logger, workers=1):
+        self.connect = connect
+        self.logger = logger
+        self.workers = workers
+        self.jobs = {}
+        self.connections = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.elapsed = None
+
+    def add(self, name, run, after=(), target=None):
+        if name in self.jobs:
+            raise ValueError(f'Job {name} has already been added')
+        self.jobs[name] = Job(name, run, after, target)
+
+        return name
+
+    def connection(self, target=None):
+        if not hasattr(self.local, 'conns'):
+            self.local.conns = {}
+        if target not in self.local.conns:
+            self.local.conns[target] = self.connect() if target is None else self.connect(target)
+            with self.lock:
+                self.connections.append(self.local.conns[target])
+
+        return self.local.conns[target]
+
+    def execute(self, job):
+        conn = self.connection(job.target)
+        started = time.monotonic()
+        try:
+            job.run(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            job.elapsed = time.monotonic() - started
+
+    def ready(self, job):
+        """Returns True if job can be started, False if it has to be skipped, None if it has to wait"""
+        statuses = [self.jobs[name].status for name in job.after if name in self.jobs]
+        if any(status in ('failed', 'skipped') for status in statuses):
+            return False
+        if all(status == 'done' for status in statuses):
+            return True
+
+        return None
+
+    def run(self):
+        """Runs all jobs, returns True if all of them succeeded"""
+        started = time.monotonic()
+        pending = list(self.jobs.values())
+        running = {}
+
+        with contextlib.ExitStack() as stack:
+            pools = {}
+            for target in {job.target for job in pending}:
+                prefix = f'{target}-importer' if target is not None else 'importer'
+                pools[target] = stack.enter_context(ThreadPoolExecutor(max_workers=self.workers,
+                                                                       thread_name_prefix=prefix))
+            while pending or running:
+                for job in list(pending):
+                    ready = self.ready(job)
+                    if ready is None:
+                        continue
+                    pending.remove(job)
+                    if ready:
+                        self.logger.debug(f'Starting {job.name}')
+                        job.status = 'running'
+                        running[pools[job.target].submit(self.execute, job)] = job
+                    else:
+                        self.logger.warning(f'Skipping {job.name}, as it depends on a failed job')
+                        job.status = 'skipped'
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    try:
+                        future.result()
+                        job.status = 'done'
+                        self.logger.debug(f'Finished {job.name} in {job.elapsed:.1f}s')
+                    except Exception as e:
+                        job.status = 'failed'
+                        job.error = e
+                        self.logger.exception(f'Job {job.name} failed', exc_info=e)
+
+        for job in pending:
+            self.logger.error(f'Skipping {job.name}, as its dependencies can not be satisfied')
+            job.status = 'skipped'
+
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+        self.elapsed = time.monotonic() - started
+
+        return all(job.status == 'done' for job in self.jobs.values())
+
+    def summary(self):
+        if not self.jobs:
+            return
+
+        targets = len({job.target for job in self.jobs.values()})
+        per_target = ' per target database' if targets > 1 else ''
+        self.logger.info(f'{len(self.jobs)} job(s) in {self.elapsed:.1f}s using {self.workers} worker(s){per_target}:')
+        for job in sorted(self.jobs.values(), key=lambda job: -(job.elapsed or 0)):
+            elapsed = f'{job.elapsed:.1f}s' if job.elapsed is not None else '-'
+            self.logger.info(f'{elapsed:>10} {job.status:>8} {job.name}')
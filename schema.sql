@@ -13,6 +13,7 @@ CREATE TABLE public.aw_ciems (
     deleted_at date,
     is_small boolean DEFAULT false NOT NULL,
     full_name character varying(256) NOT NULL,
+    row_hash character(32) DEFAULT NULL,
     updated boolean DEFAULT false NOT NULL
 );
 
@@ -39,10 +40,14 @@ CREATE TABLE public.aw_eka (
     lat numeric(9,7) NOT NULL,
     lng numeric(9,7) NOT NULL,
     geom public.geometry(Point,4326),
+    -- Filled only when importing with --native-geom
+    geom_3059 public.geometry(Point,3059),
+    row_hash character(32) DEFAULT NULL,
     updated boolean DEFAULT false NOT NULL
 );
 
 CREATE INDEX aw_eka_geom_idx ON public.aw_eka USING gist (geom);
+CREATE INDEX aw_eka_geom_3059_idx ON public.aw_eka USING gist (geom_3059);
 
 CREATE TABLE public.aw_iela (
     code numeric(9,0) PRIMARY KEY,
@@ -59,6 +64,7 @@ CREATE TABLE public.aw_iela (
     deleted_at date,
     attr character varying(2) DEFAULT NULL::character varying,
     full_name character varying(256) NOT NULL,
+    row_hash character(32) DEFAULT NULL,
     updated boolean DEFAULT false NOT NULL
 );
 
@@ -77,6 +83,7 @@ CREATE TABLE public.aw_novads (
     deleted_at date,
     atvk character varying(32) NOT NULL,
     full_name character varying(256) NOT NULL,
+    row_hash character(32) DEFAULT NULL,
     updated boolean DEFAULT false NOT NULL
 );
 
@@ -95,6 +102,7 @@ CREATE TABLE public.aw_pagasts (
     deleted_at date,
     atvk character varying(32) NOT NULL,
     full_name character varying(256) NOT NULL,
+    row_hash character(32) DEFAULT NULL,
     updated boolean DEFAULT false NOT NULL
 );
 
@@ -113,11 +121,26 @@ CREATE TABLE public.aw_pilseta (
     deleted_at date,
     atvk character varying(32) NOT NULL,
     full_name character varying(256) NOT NULL,
+    row_hash character(32) DEFAULT NULL,
     updated boolean DEFAULT false NOT NULL
 );
 
+CREATE INDEX aw_iela_parent_code_idx ON public.aw_iela (parent_code);
+CREATE INDEX aw_ciems_parent_code_idx ON public.aw_ciems (parent_code);
+CREATE INDEX aw_pilseta_parent_code_idx ON public.aw_pilseta (parent_code);
+CREATE INDEX aw_pagasts_parent_code_idx ON public.aw_pagasts (parent_code);
+CREATE INDEX aw_eka_parent_code_idx ON public.aw_eka (parent_code);
+
+-- Codes written by the last import, consumed by incremental maintenance of aw_full_addresses (NULL code means that
+-- the whole table has been rewritten)
+CREATE UNLOGGED TABLE public.aw_pending_changes (
+    table_name character varying(16) NOT NULL,
+    code numeric(9,0)
+);
+
 DROP MATERIALIZED VIEW IF EXISTS public.aw_full_addresses;
-CREATE MATERIALIZED VIEW aw_full_addresses
+DROP VIEW IF EXISTS public.aw_full_addresses_source;
+CREATE VIEW aw_full_addresses_source
 AS
 SELECT e.code,
        e.name,
@@ -205,6 +228,15 @@ FROM aw_eka e
      -- [!] We do not have a village which would be directly inside a county without a parish inbetween.
 WHERE e.status = 'EKS';
 
+-- For incremental maintenance (--incremental-view) create aw_full_addresses as a table instead:
+-- CREATE TABLE aw_full_addresses AS SELECT * FROM aw_full_addresses_source;
+-- ALTER TABLE aw_full_addresses ADD PRIMARY KEY (code);
+CREATE MATERIALIZED VIEW aw_full_addresses
+AS
+SELECT * FROM aw_full_addresses_source;
+
+-- Allows concurrent refresh
+CREATE UNIQUE INDEX aw_full_ads_code_idx ON public.aw_full_addresses (code);
 CREATE INDEX aw_full_ads_geom_idx ON public.aw_full_addresses USING gist (geom);
 
 
@@ -214,9 +246,16 @@ CREATE TABLE public.marks (
     object_type character varying(14) NOT NULL,
     mark_type integer NOT NULL,
     date date DEFAULT NULL,
+    row_hash character(32) DEFAULT NULL,
     updated boolean DEFAULT false NOT NULL
 );
 
+DROP TABLE IF EXISTS public.mark_types;
+CREATE TABLE public.mark_types (
+    id integer PRIMARY KEY,
+    description character varying(256) DEFAULT NULL
+);
+
 DROP TABLE IF EXISTS public.valuations;
 CREATE TABLE public.valuations (
     cadastre_nr character varying(17) PRIMARY KEY,
@@ -229,6 +268,7 @@ CREATE TABLE public.valuations (
     object_cadastral_value_date date default null,
     object_forest_value integer default null,
     object_forest_value_date date default null,
+    row_hash character(32) DEFAULT NULL,
     updated boolean DEFAULT false NOT NULL
 );
 
@@ -243,6 +283,7 @@ CREATE TABLE public.addresses (
     town character varying(128) DEFAULT NULL,
     village character varying(128) DEFAULT NULL,
     house character varying(128) DEFAULT NULL,
+    row_hash character(32) default null,
     updated boolean default false not null
 );
 
@@ -264,6 +305,126 @@ CREATE TABLE public.ownerships (
     object_type character varying(14) NOT NULL,
     ownership_status_id int not null,
     person_status_id int not null,
+    row_hash character(32) default null,
     updated boolean default false not null
 );
 
+DROP TABLE IF EXISTS public.properties;
+CREATE TABLE public.properties (
+    cadastre_nr character varying(17) NOT NULL,
+    object_type character varying(14) NOT NULL,
+    name character varying(256) DEFAULT NULL,
+    part_cadastre_nr character varying(17) NOT NULL,
+    part_type character varying(14) DEFAULT NULL,
+    row_hash character(32) DEFAULT NULL,
+    updated boolean DEFAULT false NOT NULL,
+    CONSTRAINT properties_pkey PRIMARY KEY (cadastre_nr, part_cadastre_nr)
+);
+
+DROP TABLE IF EXISTS public.parcels;
+CREATE TABLE public.parcels (
+    cadastre_nr character varying(17) PRIMARY KEY,
+    object_type character varying(14) NOT NULL,
+    area bigint DEFAULT NULL,
+    liz_value integer DEFAULT NULL,
+    row_hash character(32) DEFAULT NULL,
+    updated boolean DEFAULT false NOT NULL
+);
+
+DROP TABLE IF EXISTS public.parcel_parts;
+CREATE TABLE public.parcel_parts (
+    cadastre_nr character varying(17) PRIMARY KEY,
+    object_type character varying(14) NOT NULL,
+    area bigint DEFAULT NULL,
+    liz_value integer DEFAULT NULL,
+    row_hash character(32) DEFAULT NULL,
+    updated boolean DEFAULT false NOT NULL
+);
+
+DROP TABLE IF EXISTS public.encumbrances;
+CREATE TABLE public.encumbrances (
+    cadastre_nr character varying(17) NOT NULL,
+    object_type character varying(14) NOT NULL,
+    nr integer NOT NULL,
+    kind_id integer DEFAULT NULL,
+    kind_name character varying(512) DEFAULT NULL,
+    area double precision DEFAULT NULL,
+    establish_date date DEFAULT NULL,
+    row_hash character(32) DEFAULT NULL,
+    updated boolean DEFAULT false NOT NULL,
+    CONSTRAINT encumbrances_pkey PRIMARY KEY (cadastre_nr, nr)
+);
+
+DROP TABLE IF EXISTS public.buildings;
+CREATE TABLE public.buildings (
+    cadastre_nr character varying(17) PRIMARY KEY,
+    object_type character varying(14) NOT NULL,
+    name character varying(256) DEFAULT NULL,
+    use_kind_id integer DEFAULT NULL,
+    use_kind_name character varying(256) DEFAULT NULL,
+    area double precision DEFAULT NULL,
+    construction_area double precision DEFAULT NULL,
+    ground_floors integer DEFAULT NULL,
+    underground_floors integer DEFAULT NULL,
+    exploitation_year integer DEFAULT NULL,
+    fire_resistance character varying(16) DEFAULT NULL,
+    premise_group_count integer DEFAULT NULL,
+    deprecation integer DEFAULT NULL,
+    deprecation_date date DEFAULT NULL,
+    row_hash character(32) DEFAULT NULL,
+    updated boolean DEFAULT false NOT NULL
+);
+
+DROP TABLE IF EXISTS public.premise_groups;
+CREATE TABLE public.premise_groups (
+    cadastre_nr character varying(17) PRIMARY KEY,
+    object_type character varying(14) NOT NULL,
+    name character varying(256) DEFAULT NULL,
+    building_floor integer DEFAULT NULL,
+    use_kind_id integer DEFAULT NULL,
+    use_kind_name character varying(256) DEFAULT NULL,
+    premise_count integer DEFAULT NULL,
+    area double precision DEFAULT NULL,
+    row_hash character(32) DEFAULT NULL,
+    updated boolean DEFAULT false NOT NULL
+);
+
+
+
+-- Territory archives (and their layers) imported by kadastrs.py
+DROP TABLE IF EXISTS public.kadastrs_archives;
+CREATE TABLE public.kadastrs_archives (
+    archive character varying(128) NOT NULL,
+    layer character varying(64) NOT NULL,
+    etag character varying(256) DEFAULT NULL,
+    sha256 character(64) NOT NULL,
+    file_key character varying(512) NOT NULL,
+    imported_at timestamp with time zone DEFAULT now() NOT NULL,
+    PRIMARY KEY (archive, layer)
+);
+
+-- Progress of imports committed in parts (--commit-every), to be continued with --resume
+DROP TABLE IF EXISTS public.import_checkpoints;
+CREATE TABLE public.import_checkpoints (
+    table_name character varying(64) PRIMARY KEY,
+    file_name character varying(256) NOT NULL,
+    file_hash character varying(80) NOT NULL,
+    rows integer DEFAULT 0 NOT NULL,
+    written integer DEFAULT 0 NOT NULL,
+    completed boolean DEFAULT false NOT NULL,
+    updated_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+-- Changes (inserted, updated and deleted rows) recorded by imports run with --changes, for downstream consumers
+DROP TABLE IF EXISTS public.vzd_changes;
+CREATE TABLE public.vzd_changes (
+    id bigserial PRIMARY KEY,
+    run_id character varying(32) NOT NULL,
+    table_name character varying(64) NOT NULL,
+    operation character varying(6) NOT NULL,
+    key jsonb NOT NULL,
+    changes jsonb,
+    created_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+CREATE INDEX vzd_changes_run_id_idx ON public.vzd_changes (run_id);
@@ -0,0 +1,303 @@
+"""
+Compact, memory-mapped snapshot of aw_full_addresses for lookups without database round trips.
+
+Snapshot is a single file of fixed-width column arrays, which are used straight from the mapping (typed memoryviews),
+so opening it costs a single header read, and its pages are shared by every process that maps it.
+"""
+import argparse
+import array
+import bisect
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import unicodedata
+
+MAGIC = b'VZDSNAP1'
+HEADER = struct.Struct('<8sII')
+SECTION = struct.Struct('<24sQQ')
+NULL = 0xFFFFFFFF
+CELL_SIZE = 0.01
+EARTH_RADIUS = 6371008.8
+
+TEXT_COLUMNS = ['name', 'full_name', 'iela_name', 'ciems_name', 'pilseta_name', 'pagasts_name', 'novads_name']
+CODE_COLUMNS = ['ciems_code', 'pilseta_code', 'pagasts_code', 'novads_code', 'parent_code', 'parent_type']
+
+
+def normalize(text):
+    """Returns text in lower case, without diacritics and punctuation, e.g. 'Brīvības iela 1, Rīga' => 'brivibas iela 1
+    riga'"""
+    text = ''.join(c for c in unicodedata.normalize('NFKD', text.casefold()) if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'\W+', ' ', text).split())
+
+
+def cell(lat, lng, size=CELL_SIZE):
+    return math.floor(lat / size), math.floor(lng / size)
+
+
+def cell_key(row, column):
+    return (row + 2 ** 31) << 32 | (column + 2 ** 31)
+
+
+def distance(lat1, lng1, lat2, lng2):
+    """Returns great-circle distance in meters"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+
+    return 2 * EARTH_RADIUS * math.asin(min(math.sqrt(a), 1))
+
+
+def string_table(values):
+    offsets = array.array('I', [0])
+    data = bytearray()
+    for value in values:
+        data += value.encode()
+        offsets.append(len(data))
+
+    return offsets, bytes(data)
+
+
+def export(conn, file_name, logger, cell_size=CELL_SIZE):
+    """Writes snapshot of aw_full_addresses into file_name, replacing it atomically"""
+    columns = {'code': array.array('I'), 'lat': array.array('d'), 'lng': array.array('d')}
+    columns |= {column: array.array('I') for column in CODE_COLUMNS + TEXT_COLUMNS}
+    dictionaries = {column: {} for column in TEXT_COLUMNS}
+
+    with conn.cursor(name='snapshot') as cur:
+        cur.itersize = 10000
+        cur.execute(f'SELECT code, ST_Y(geom), ST_X(geom), {", ".join(CODE_COLUMNS + TEXT_COLUMNS)} '
+                    f'FROM aw_full_addresses ORDER BY code')
+        for row in cur:
+            code, lat, lng, *values = row
+            columns['code'].append(int(code))
+            columns['lat'].append(lat if lat is not None else math.nan)
+            columns['lng'].append(lng if lng is not None else math.nan)
+            for column, value in zip(CODE_COLUMNS, values):
+                columns[column].append(int(value) if value is not None else NULL)
+            for column, value in zip(TEXT_COLUMNS, values[len(CODE_COLUMNS):]):
+                values_of = dictionaries[column]
+                columns[column].append(values_of.setdefault(value, len(values_of)) if value is not None else NULL)
+
+    count = len(columns['code'])
+    sections = {column: values for column, values in columns.items()}
+    for column, values_of in dictionaries.items():
+        sections[f'{column}.offsets'], sections[f'{column}.data'] = string_table(values_of)
+
+    # Prefix index: normalized full names in sorted order, and rows they belong to
+    full_names = list(dictionaries['full_name'])
+    keys = sorted((normalize(full_names[i]), row) for row, i in enumerate(columns['full_name']) if i != NULL)
+    sections['prefix.offsets'], sections['prefix.data'] = string_table(key for key, _ in keys)
+    sections['prefix.rows'] = array.array('I', (row for _, row in keys))
+
+    # Spatial grid: rows sorted by cell, and sorted cell keys with positions of their first rows
+    cells = sorted((cell_key(*cell(lat, lng, cell_size)), row)
+                   for row, (lat, lng) in enumerate(zip(columns['lat'], columns['lng'])) if not math.isnan(lat))
+    sections['grid.rows'] = array.array('I', (row for _, row in cells))
+    sections['grid.keys'] = array.array('Q')
+    sections['grid.starts'] = array.array('I')
+    for i, (key, _) in enumerate(cells):
+        if not sections['grid.keys'] or sections['grid.keys'][-1] != key:
+            sections['grid.keys'].append(key)
+            sections['grid.starts'].append(i)
+    sections['grid.starts'].append(len(cells))
+
+    located = [row for _, row in cells]
+    meta = {
+        'count': count,
+        'cell_size': cell_size,
+        'bounds': [min((columns['lat'][row] for row in located), default=0),
+                   min((columns['lng'][row] for row in located), default=0),
+                   max((columns['lat'][row] for row in located), default=0),
+                   max((columns['lng'][row] for row in located), default=0)],
+    }
+    sections['meta'] = json.dumps(meta).encode()
+
+    offset = HEADER.size + SECTION.size * len(sections)
+    table = []
+    for name, values in sections.items():
+        offset += -offset % 8
+        data = values.tobytes() if isinstance(values, array.array) else values
+        table.append((name, offset, data))
+        offset += len(data)
+
+    with open(f'{file_name}.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, 1, len(table)))
+        for name, offset, data in table:
+            f.write(SECTION.pack(name.encode(), offset, len(data)))
+        for name, offset, data in table:
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(data)
+    os.replace(f'{file_name}.tmp', file_name)
+
+    logger.info(f'Snapshot of {count} addresses written to {file_name} ({os.path.getsize(file_name)} bytes)')
+
+
+class Strings:
+    """Sequence of strings stored as offsets into UTF-8 data"""
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+
+class AddressSnapshot:
+    """
+    Read-only lookups in a snapshot written by export(): resolve(code), search(prefix) and nearest(lat, lng).
+
+    Addresses are returned as dicts with the same keys as columns of aw_full_addresses (and lat, lng instead of geom).
+    """
+
+    def __init__(self, file_name):
+        with open(file_name, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mmap)
+
+        magic, version, count = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC or version != 1:
+            raise ValueError(f'{file_name} is not an address snapshot')
+        self.sections = {}
+        for i in range(count):
+            name, offset, length = SECTION.unpack_from(self.mmap, HEADER.size + i * SECTION.size)
+            self.sections[name.rstrip(b'\0').decode()] = self.view[offset:offset + length]
+
+        self.meta = json.loads(bytes(self.sections['meta']))
+        self.codes = self.column('code', 'I')
+        self.lat = self.column('lat', 'd')
+        self.lng = self.column('lng', 'd')
+        self.columns = {column: self.column(column, 'I') for column in CODE_COLUMNS + TEXT_COLUMNS}
+        self.values = {column: Strings(self.column(f'{column}.offsets', 'I'), self.sections[f'{column}.data'])
+                       for column in TEXT_COLUMNS}
+        self.prefixes = Strings(self.column('prefix.offsets', 'I'), self.sections['prefix.data'])
+        self.prefix_rows = self.column('prefix.rows', 'I')
+        self.grid_keys = self.column('grid.keys', 'Q')
+        self.grid_starts = self.column('grid.starts', 'I')
+        self.grid_rows = self.column('grid.rows', 'I')
+
+    def column(self, name, format):
+        return self.sections[name].cast(format)
+
+    def close(self):
+        # Views into the mapping have to be released before it can be closed
+        for values in [self.codes, self.lat, self.lng, self.prefix_rows, self.grid_keys, self.grid_starts,
+                       self.grid_rows, *self.columns.values(), *self.sections.values()]:
+            values.release()
+        for strings in [self.prefixes, *self.values.values()]:
+            strings.offsets.release()
+        self.view.release()
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row):
+        address = {'code': self.codes[row]}
+        for column in CODE_COLUMNS:
+            address[column] = self.columns[column][row] if self.columns[column][row] != NULL else None
+        for column in TEXT_COLUMNS:
+            i = self.columns[column][row]
+            address[column] = self.values[column][i] if i != NULL else None
+        located = not math.isnan(self.lat[row])
+        address['lat'] = self.lat[row] if located else None
+        address['lng'] = self.lng[row] if located else None
+
+        return address
+
+    def resolve(self, code):
+        """Returns address with the given code, or None"""
+        row = bisect.bisect_left(self.codes, code)
+        if row < len(self.codes) and self.codes[row] == code:
+            return self[row]
+
+        return None
+
+    def search(self, prefix, limit=10):
+        """Returns addresses whose normalized full name starts with normalized prefix"""
+        prefix = normalize(prefix)
+        addresses = []
+        i = bisect.bisect_left(self.prefixes, prefix)
+        while i < len(self.prefixes) and len(addresses) < limit and self.prefixes[i].startswith(prefix):
+            addresses.append(self[self.prefix_rows[i]])
+            i += 1
+
+        return addresses
+
+    def cell_rows(self, key):
+        i = bisect.bisect_left(self.grid_keys, key)
+        if i < len(self.grid_keys) and self.grid_keys[i] == key:
+            return self.grid_rows[self.grid_starts[i]:self.grid_starts[i + 1]]
+
+        return ()
+
+    def nearest(self, lat, lng, limit=1, max_distance=None):
+        """Returns up to limit (distance in meters, address) pairs nearest to the point, closest first"""
+        size = self.meta['cell_size']
+        row, column = cell(lat, lng, size)
+        min_lat, min_lng, max_lat, max_lng = self.meta['bounds']
+        # Rings beyond this one do not contain any cells of the grid
+        last = max(abs(row - math.floor(min_lat / size)), abs(row - math.floor(max_lat / size)),
+                   abs(column - math.floor(min_lng / size)), abs(column - math.floor(max_lng / size)))
+
+        best = []
+        for ring in range(last + 1):
+            # Any point outside the rings searched so far is at least ring - 1 cells away (in latitude, or in
+            # longitude, whose degree is shortest at the highest latitude within the ring)
+            bound = max(ring - 1, 0) * size * math.pi / 180 * EARTH_RADIUS * \
+                math.cos(math.radians(min(abs(lat) + ring * size, 90)))
+            if max_distance is not None and bound > max_distance:
+                break
+            if len(best) == limit and -best[0][0] <= bound:
+                break
+
+            for i in range(row - ring, row + ring + 1):
+                step = 1 if i in (row - ring, row + ring) else 2 * ring or 1
+                for j in range(column - ring, column + ring + 1, step):
+                    for candidate in self.cell_rows(cell_key(i, j)):
+                        meters = distance(lat, lng, self.lat[candidate], self.lng[candidate])
+                        if max_distance is not None and meters > max_distance:
+                            continue
+                        if len(best) < limit:
+                            heapq.heappush(best, (-meters, candidate))
+                        elif meters < -best[0][0]:
+                            heapq.heapreplace(best, (-meters, candidate))
+
+        return [(-meters, self[candidate]) for meters, candidate in sorted(best, reverse=True)]
+
+
+if __name__ == '__main__':
+    args_parser = argparse.ArgumentParser(description='Looks up addresses in a snapshot written with main.py --snapshot')
+    args_parser.add_argument('snapshot', help='Snapshot file name')
+    args_parser.add_argument('--code', type=int, help='Address code to resolve')
+    args_parser.add_argument('--search', help='Full name prefix to search for')
+    args_parser.add_argument('--nearest', help='Coordinates (lat,lng) to find nearest addresses to')
+    args_parser.add_argument('--limit', type=int, default=10, help='Maximum number of addresses to return')
+    args = args_parser.parse_args()
+
+    with AddressSnapshot(args.snapshot) as snapshot:
+        if args.code is not None:
+            results = [snapshot.resolve(args.code)]
+        elif args.search is not None:
+            results = snapshot.search(args.search, args.limit)
+        elif args.nearest is not None:
+            lat, lng = map(float, args.nearest.split(','))
+            results = [address | {'distance': round(meters, 1)}
+                       for meters, address in snapshot.nearest(lat, lng, args.limit)]
+        else:
+            results = [snapshot.meta]
+        json.dump(results, sys.stdout, ensure_ascii=False, indent=2)
+        print()